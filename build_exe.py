@@ -8,6 +8,7 @@ import sys
 import os
 import threading
 import webbrowser
+from multiprocessing import freeze_support
 
 # When running from a PyInstaller bundle, sys._MEIPASS points to the
 # temporary directory where bundled files are extracted.  We need to
@@ -18,7 +19,7 @@ if getattr(sys, 'frozen', False):
 
 # Import the Flask app *after* adjusting paths so that web_app.py
 # picks up the correct template_folder.
-from web_app import app  # noqa: E402
+from web_app import run_server  # noqa: E402
 
 
 def open_browser():
@@ -29,7 +30,9 @@ def open_browser():
 
 
 if __name__ == '__main__':
+    # Required so the upload scanner's worker processes can start from the frozen exe
+    freeze_support()
     threading.Thread(target=open_browser, daemon=True).start()
     print('Starting Tax App — opening browser to http://localhost:8080')
     print('Press Ctrl+C to quit.')
-    app.run(debug=False, port=8080)
+    run_server(8080)
@@ -166,6 +166,19 @@ def build_tax_inputs(scanned_forms: list) -> dict:
     }
 
 
+def split_stock_gains(stock_results: list) -> tuple:
+    """Sum stock gains into (short_term, long_term) in a single pass."""
+    st_gains = 0.0
+    lt_gains = 0.0
+    for r in stock_results:
+        gain = r.get('total_gain', 0)
+        if r.get('is_long_term', False):
+            lt_gains += gain
+        else:
+            st_gains += gain
+    return st_gains, lt_gains
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Tax App — Scan tax forms and calculate federal + CA taxes',
@@ -243,7 +256,8 @@ Examples:
     calc = TaxCalculator(tax_year=tax_year, filing_status=args.status)
 
     # Build itemized deductions if we have 1098 data
-    stock_gains = sum(r.get('total_gain', 0) for r in inputs['stock_results'])
+    st_gains, lt_gains = split_stock_gains(inputs['stock_results'])
+    stock_gains = st_gains + lt_gains
     estimated_agi = inputs['w2_wages'] + inputs['interest_income'] + stock_gains
 
     itemized_result = None
@@ -273,14 +287,6 @@ Examples:
     # CA state tax (if state wages exist)
     ca_report = ''
     if inputs['state_wages'] > 0:
-        st_gains = sum(
-            r.get('total_gain', 0) for r in inputs['stock_results']
-            if not r.get('is_long_term', False)
-        )
-        lt_gains = sum(
-            r.get('total_gain', 0) for r in inputs['stock_results']
-            if r.get('is_long_term', False)
-        )
         ca_itemized = None
         if inputs['mortgage_interest'] > 0 or inputs['property_taxes'] > 0:
             # CA doesn't allow SALT; just mortgage interest + property taxes
@@ -300,8 +306,7 @@ Examples:
 
     # Output
     if args.output:
-        os.makedirs('outputs', exist_ok=True)
-        output_path = os.path.join('outputs', args.output)
+        output_path = os.path.join(calc.ensure_output_dir(), args.output)
         with open(output_path, 'w') as f:
             f.write(full_report)
         print(f"\nReport saved to: {output_path}")
@@ -36,6 +36,8 @@ a = Analysis(
         'form_parsers.paystub_parser',
         # --- third-party ---
         'flask',
+        'waitress',
+        'orjson',
         'jinja2',
         'jinja2.ext',
         'pdfplumber',
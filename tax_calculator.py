@@ -6,10 +6,96 @@ A comprehensive tool for calculating taxes on Tesla stock grants (RSUs and ESPP)
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
-import yfinance as yf
+from typing import TYPE_CHECKING, Dict, List, Tuple, Optional
 import re
+import io
 import os
+import bisect
+import csv
+import functools
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+if TYPE_CHECKING:
+    import yfinance
+
+# On-disk cache of daily closing prices, shared across runs
+PRICE_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'taxapp', 'price_cache.db')
+
+# Days either side of a date to request when looking up a closing price,
+# narrowest first
+PRICE_LOOKUP_WINDOWS = (3, 10)
+
+# Values classify_stock_type can return
+STOCK_TYPES = ['RSU', 'ESPP', 'Unknown']
+
+# Currency symbols, commas, and whitespace stripped before parsing amounts
+_CURRENCY_RE = re.compile(r'[\$,\s]')
+
+
+class SqliteCache:
+    """
+    An sqlite cache file, opened (and created) on first use and shared across
+    threads. If it can't be opened, a warning is printed once and
+    connection() returns None from then on, so callers just skip the cache.
+    """
+
+    def __init__(self, path: str, schema: str, name: str, consequence: str):
+        self.path = path
+        # Hold while calling connection() and using the connection it returns
+        self.lock = threading.Lock()
+        self._schema = schema
+        self._name = name
+        self._consequence = consequence
+        self._conn = None
+        self._unavailable = False
+
+    def connection(self) -> Optional[sqlite3.Connection]:
+        """The open connection, or None if the cache is unavailable."""
+        if self._conn is None and not self._unavailable:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                # Owner-only: these files hold personal financial data. sqlite
+                # gives its -wal/-shm files the same mode as the database.
+                os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+                os.chmod(self.path, 0o600)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(self._schema)
+                conn.commit()
+                self._conn = conn
+            except (sqlite3.Error, OSError) as e:
+                print(f"Warning: {self._name} unavailable ({e}), {self._consequence}")
+                self._unavailable = True
+        return self._conn
+
+
+# Persistent (symbol, date) -> close cache, shared by all calculators
+_price_db = SqliteCache(
+    PRICE_CACHE_PATH,
+    'CREATE TABLE IF NOT EXISTS prices ('
+    'symbol TEXT, date TEXT, close REAL, PRIMARY KEY (symbol, date));',
+    'Price cache', 'prices will not be persisted',
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _tesla_offer_date(year: int, month: int) -> datetime:
+    """Offer date for an ESPP purchase made in the given year/month."""
+    # Tesla ESPP periods:
+    # - February 1 to July 31 (purchase in July/August)
+    # - August 1 to January 31 (purchase in January/February of next year)
+
+    if month <= 2:
+        # Purchase in Jan/Feb means offer was from previous August
+        return datetime(year - 1, 8, 1)
+    elif month <= 8:
+        # Purchase in Mar-Aug means offer was from February of same year
+        return datetime(year, 2, 1)
+    else:
+        # Purchase in Sep-Dec means offer was from August of same year
+        return datetime(year, 8, 1)
 
 
 class TaxCalculator:
@@ -17,7 +103,11 @@ class TaxCalculator:
 
     VALID_FILING_STATUSES = ('single', 'mfj', 'mfs', 'hoh')
 
-    def __init__(self, tax_year: int = None, filing_status: str = 'single'):
+    # Output directories already created by this process
+    _ready_output_dirs = set()
+
+    def __init__(self, tax_year: int = None, filing_status: str = 'single',
+                 output_dir: str = 'outputs'):
         # Tax year defaults to current year, but can be overridden (e.g., filing 2025 in 2026)
         self.current_year = tax_year if tax_year else datetime.now().year
 
@@ -55,6 +145,14 @@ class TaxCalculator:
         # CA SDI rate (informational - already withheld via W-2 box 14)
         self.ca_sdi_rate = 0.012
 
+        # Where reports and CSV exports are written
+        self.output_dir = output_dir
+
+        # Closing prices already fetched this session, keyed by (symbol, 'YYYY-MM-DD')
+        self._price_cache = {}
+        # One yfinance Ticker per symbol, reused across lookups
+        self._tickers = {}
+
         # Load tax brackets for the target year
         self._load_tax_brackets()
         
@@ -69,6 +167,45 @@ class TaxCalculator:
             self._use_2025_tax_brackets()
             if years_diff != 0:
                 self._apply_inflation_adjustment(inflation_factor)
+        self._build_rate_lookup()
+
+    def _build_rate_lookup(self):
+        """Split the active brackets into sorted threshold/rate lists for bisect lookups."""
+        self._ord_thresholds = [t for t, _ in self.tax_brackets]
+        self._ord_rates = [r for _, r in self.tax_brackets]
+        self._cg_thresholds = [t for t, _ in self.capital_gains_brackets]
+        self._cg_rates = [r for _, r in self.capital_gains_brackets]
+        # Tax owed at each threshold, so total tax is one lookup plus one multiply-add
+        self._ord_cum = self._cumulative_bracket_tax(self.tax_brackets)
+        self._cg_cum = self._cumulative_bracket_tax(self.capital_gains_brackets)
+
+    @staticmethod
+    def _cumulative_bracket_tax(brackets: List[Tuple[float, float]]) -> np.ndarray:
+        """Tax owed on income exactly at each bracket threshold."""
+        widths = [(t_next - t) * rate for (t, rate), (t_next, _) in zip(brackets, brackets[1:])]
+        return np.concatenate(([0.0], np.cumsum(widths)))
+
+    @staticmethod
+    def _tax_from_table(thresholds, rates, cumulative, income: float) -> float:
+        """Closed-form progressive tax using a precomputed cumulative table."""
+        if income <= 0:
+            return 0.0
+        idx = max(int(np.searchsorted(thresholds, income, 'right')) - 1, 0)
+        return float(cumulative[idx] + (income - thresholds[idx]) * rates[idx])
+
+    def calculate_ordinary_tax_owed(self, taxable_ordinary_income: float) -> float:
+        """Total federal ordinary income tax, without the per-bracket breakdown."""
+        return self._tax_from_table(self._ord_thresholds, self._ord_rates,
+                                    self._ord_cum, taxable_ordinary_income)
+
+    def calculate_ltcg_tax_owed(self, taxable_ordinary_income: float, long_term_gains: float) -> float:
+        """Total LTCG tax with gains stacked on top of ordinary income."""
+        if long_term_gains <= 0:
+            return 0.0
+        base = max(taxable_ordinary_income, 0)
+        table = (self._cg_thresholds, self._cg_rates, self._cg_cum)
+        return (self._tax_from_table(*table, base + long_term_gains)
+                - self._tax_from_table(*table, base))
 
     def _apply_inflation_adjustment(self, inflation_factor):
         """Apply inflation adjustment to tax brackets from 2025 base values."""
@@ -175,28 +312,30 @@ class TaxCalculator:
         
     def calculate_marginal_tax_rate(self, ordinary_income: float) -> float:
         """Calculate the marginal tax rate based on ordinary income."""
-        for threshold, rate in reversed(self.tax_brackets):
-            if ordinary_income > threshold:
-                return rate
-        return self.tax_brackets[0][1]
+        # Highest bracket whose threshold is strictly below the income
+        idx = bisect.bisect_left(self._ord_thresholds, ordinary_income) - 1
+        return self._ord_rates[max(idx, 0)]
 
     def calculate_capital_gains_rate(self, ordinary_income: float) -> float:
         """Calculate the capital gains tax rate based on ordinary income."""
-        for threshold, rate in reversed(self.capital_gains_brackets):
-            if ordinary_income > threshold:
-                return rate
-        return self.capital_gains_brackets[0][1]
+        idx = bisect.bisect_left(self._cg_thresholds, ordinary_income) - 1
+        return self._cg_rates[max(idx, 0)]
     
-    def calculate_progressive_ordinary_tax(self, taxable_ordinary_income: float) -> Tuple[float, List[Dict]]:
+    def calculate_progressive_ordinary_tax(self, taxable_ordinary_income: float,
+                                           include_details: bool = True) -> Tuple[float, List[Dict]]:
         """
         Calculate federal income tax using progressive bracket application.
 
         Returns:
             Tuple of (total_tax, bracket_details) where bracket_details shows
             how much income fell in each bracket and the tax on that portion.
+            With include_details=False the total comes from the cumulative
+            bracket table and bracket_details is empty.
         """
         if taxable_ordinary_income <= 0:
             return 0.0, []
+        if not include_details:
+            return self.calculate_ordinary_tax_owed(taxable_ordinary_income), []
 
         total_tax = 0.0
         bracket_details = []
@@ -228,14 +367,18 @@ class TaxCalculator:
         return total_tax, bracket_details
 
     def calculate_progressive_ltcg_tax(self, taxable_ordinary_income: float,
-                                        long_term_gains: float) -> Tuple[float, List[Dict]]:
+                                        long_term_gains: float,
+                                        include_details: bool = True) -> Tuple[float, List[Dict]]:
         """
         Calculate long-term capital gains tax progressively.
         LTCG brackets are based on total taxable income. Ordinary income fills
         the brackets first, then LTCG stacks on top.
+        include_details behaves as in calculate_progressive_ordinary_tax.
         """
         if long_term_gains <= 0:
             return 0.0, []
+        if not include_details:
+            return self.calculate_ltcg_tax_owed(taxable_ordinary_income, long_term_gains), []
 
         total_tax = 0.0
         bracket_details = []
@@ -278,6 +421,8 @@ class TaxCalculator:
         Calculate Net Investment Income Tax (3.8% surtax).
         Applies to single filers with MAGI > $200,000.
         """
+        if agi <= self.niit_threshold or net_investment_income <= 0:
+            return 0.0
         excess_agi = max(0, agi - self.niit_threshold)
         niit_base = min(excess_agi, net_investment_income)
         return niit_base * self.niit_rate
@@ -440,8 +585,10 @@ class TaxCalculator:
         """Parse currency string to float."""
         if pd.isna(value) or value == '':
             return 0.0
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            return float(value)  # Already numeric, skip the string cleanup
         # Remove currency symbols, commas, and spaces
-        cleaned = re.sub(r'[\$,\s]', '', str(value))
+        cleaned = _CURRENCY_RE.sub('', str(value))
         try:
             return float(cleaned)
         except ValueError:
@@ -462,28 +609,46 @@ class TaxCalculator:
                 except ValueError:
                     raise ValueError(f"Unable to parse date: {date_str}")
     
+    def parse_currency_column(self, values: pd.Series) -> pd.Series:
+        """Vectorized parse_currency: blank or unparseable cells become 0.0."""
+        if pd.api.types.is_numeric_dtype(values):
+            return values.astype(float).fillna(0.0)  # Clean numeric export, nothing to strip
+        cleaned = values.astype(str).str.replace(_CURRENCY_RE, '', regex=True)
+        return pd.to_numeric(cleaned, errors='coerce').fillna(0.0)
+
+    def parse_date_column(self, values: pd.Series) -> pd.Series:
+        """
+        Vectorized parse_date. Tries the same formats in the same order;
+        blank cells become NaT. Anything the fast path can't handle goes
+        through parse_date, which raises on genuinely invalid dates.
+        """
+        parsed = pd.to_datetime(values, format='%d-%b-%y', errors='coerce')
+        for fmt in ('%d-%b-%Y', '%Y-%m-%d'):
+            parsed = parsed.fillna(pd.to_datetime(values, format=fmt, errors='coerce'))
+
+        unparsed = parsed.isna() & values.notna() & (values.astype(str).str.strip() != '')
+        if unparsed.any():
+            parsed[unparsed] = values[unparsed].map(self.parse_date)
+        return parsed
+
     def is_long_term(self, acquired_date: datetime, sold_date: datetime) -> bool:
         """Determine if the holding period qualifies for long-term capital gains."""
         return (sold_date - acquired_date).days > 365
     
     def get_tesla_offer_date(self, purchase_date: datetime) -> datetime:
         """Infer the ESPP offer date based on Tesla's ESPP schedule."""
-        year = purchase_date.year
-        
-        # Tesla ESPP periods:
-        # - February 1 to July 31 (purchase in July/August)
-        # - August 1 to January 31 (purchase in January/February of next year)
-        
-        if purchase_date.month <= 2:
-            # Purchase in Jan/Feb means offer was from previous August
-            return datetime(year - 1, 8, 1)
-        elif purchase_date.month <= 8:
-            # Purchase in Mar-Aug means offer was from February of same year
-            return datetime(year, 2, 1)
-        else:
-            # Purchase in Sep-Dec means offer was from August of same year
-            return datetime(year, 8, 1)
+        return _tesla_offer_date(purchase_date.year, purchase_date.month)
     
+    def get_tesla_offer_dates(self, purchase_dates: pd.Series) -> pd.Series:
+        """Vectorized get_tesla_offer_date over a datetime Series."""
+        year = purchase_dates.dt.year
+        month = purchase_dates.dt.month
+        # Jan/Feb -> previous August, Mar-Aug -> February, Sep-Dec -> August
+        offer_year = year - (month <= 2)
+        offer_month = np.where((month > 2) & (month <= 8), 2, 8)
+        return pd.to_datetime(pd.DataFrame({'year': offer_year, 'month': offer_month, 'day': 1},
+                                           index=purchase_dates.index))
+
     def is_qualifying_espp_disposition(self, offer_date: datetime, purchase_date: datetime, 
                                      sold_date: datetime) -> bool:
         """
@@ -499,40 +664,174 @@ class TaxCalculator:
     
     def get_stock_price(self, symbol: str, date: datetime) -> float:
         """Get stock price for a given date using yfinance."""
+        cache_key = (symbol, date.strftime('%Y-%m-%d'))
+        if cache_key in self._price_cache:
+            return self._price_cache[cache_key]
+
+        price = self._read_cached_price(symbol, cache_key[1])
+        if price is None:
+            price = self._fetch_stock_price(symbol, date)
+        # Misses are remembered too, so a date with no data is only requested
+        # once per calculator; only real prices go to the on-disk cache
+        self._price_cache[cache_key] = price
+        return price
+
+    def _read_cached_price(self, symbol: str, date_str: str) -> Optional[float]:
+        """Look up a cached closing price; None on a miss."""
+        with _price_db.lock:
+            db = _price_db.connection()
+            if db is None:
+                return None
+            row = db.execute(
+                'SELECT close FROM prices WHERE symbol = ? AND date = ?', (symbol, date_str)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _write_cached_prices(self, symbol: str, prices: List[Tuple[str, float]]) -> None:
+        """
+        Persist (date, close) pairs. Only dates before today are stored, since
+        today's close is not final until the market shuts.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        rows = [(symbol, d, float(close)) for d, close in prices if d < today]
+        if not rows:
+            return
+        with _price_db.lock:
+            db = _price_db.connection()
+            if db is None:
+                return
+            db.executemany(
+                'INSERT OR REPLACE INTO prices (symbol, date, close) VALUES (?, ?, ?)', rows
+            )
+            db.commit()
+
+    def _get_ticker(self, symbol: str) -> 'yfinance.Ticker':
+        """Return the shared yfinance Ticker for symbol, creating it on first use."""
+        ticker = self._tickers.get(symbol)
+        if ticker is None:
+            # Imported here: yfinance is slow to import and most runs never fetch prices
+            import yfinance as yf
+            # yfinance manages its own HTTP session, so none is passed in here
+            ticker = self._tickers.setdefault(symbol, yf.Ticker(symbol))
+        return ticker
+
+    def _fetch_stock_price(self, symbol: str, date: datetime) -> float:
+        """Fetch the closing price nearest to date from Yahoo Finance."""
         try:
-            ticker = yf.Ticker(symbol)
-            
-            # Get historical data around the date
-            start_date = (date - timedelta(days=10)).strftime('%Y-%m-%d')
-            end_date = (date + timedelta(days=10)).strftime('%Y-%m-%d')
+            ticker = self._get_ticker(symbol)
             
-            hist = ticker.history(start=start_date, end=end_date)
+            # Get historical data around the date. A few days either side covers
+            # weekends and holidays; only widen the request if that comes back empty.
+            for window in PRICE_LOOKUP_WINDOWS:
+                start_date = (date - timedelta(days=window)).strftime('%Y-%m-%d')
+                end_date = (date + timedelta(days=window + 1)).strftime('%Y-%m-%d')
+                hist = ticker.history(start=start_date, end=end_date)
+                if not hist.empty:
+                    break
             
             if hist.empty:
                 print(f"Warning: No data found for {symbol} around {date}")
                 return 0.0
             
-            # Find the closest trading day
-            target_date = date.strftime('%Y-%m-%d')
-            
-            # Convert index to date strings for comparison
-            hist_dates = [idx.strftime('%Y-%m-%d') for idx in hist.index]
-            
-            if target_date in hist_dates:
-                # Exact date match
-                return hist.loc[hist.index[hist_dates.index(target_date)]]['Close']
-            else:
-                # Find the closest trading day (prefer earlier dates for acquisition)
-                hist_with_dates = [(idx, abs((idx.date() - date.date()).days)) for idx in hist.index]
-                closest_date_idx = min(hist_with_dates, key=lambda x: x[1])[0]
-                price = hist.loc[closest_date_idx]['Close']
-                print(f"Note: Using {closest_date_idx.strftime('%Y-%m-%d')} price (${price:.2f}) for {symbol} on {date.strftime('%Y-%m-%d')}")
-                return price
+            hist_days, closes = self._store_history(symbol, hist)
+            return self._closest_close(symbol, date, hist_days, closes, window)
         
         except Exception as e:
             print(f"Error fetching stock price for {symbol} on {date}: {e}")
             return 0.0
-    
+
+    def _store_history(self, symbol: str, hist: pd.DataFrame) -> Tuple[pd.DatetimeIndex, pd.Series]:
+        """Put every row of a history frame into both price caches."""
+        # Trading days as naive midnight timestamps for comparison
+        hist_days = hist.index.tz_localize(None).normalize()
+
+        # Every row in the window is a free cache fill for later lookups
+        window_prices = list(zip(hist_days.strftime('%Y-%m-%d'), hist['Close']))
+        self._write_cached_prices(symbol, window_prices)
+        self._price_cache.update(((symbol, day), close) for day, close in window_prices)
+        return hist_days, hist['Close']
+
+    def _closest_close(self, symbol: str, date: datetime, hist_days: pd.DatetimeIndex,
+                       closes: pd.Series, window: int) -> float:
+        """Close on the trading day nearest to date, fetched with ±window days of history."""
+        target_date = date.strftime('%Y-%m-%d')
+
+        # argmin returns the first minimum, so ties prefer the earlier date
+        distances = np.abs((hist_days - pd.Timestamp(date.date())).days)
+        pos = int(distances.argmin())
+        price = closes.iloc[pos]
+        if distances[pos] == 0:
+            # Exact date match
+            return price
+        else:
+            closest_date = hist_days[pos]
+            print(f"Note: Using {closest_date.strftime('%Y-%m-%d')} price (${price:.2f}) for {symbol} on {target_date}")
+            # Remember the non-trading-day mapping once the whole window is
+            # in the past (a later trading day could still turn out closer)
+            if (datetime.now() - date).days > window:
+                self._write_cached_prices(symbol, [(target_date, price)])
+            return price
+
+    def _fetch_price_range(self, symbol: str, dates: List[datetime]) -> None:
+        """
+        Fill the price cache for many dates with a single history request.
+
+        Dates whose nearest trading day is not within the narrow lookup window
+        are left uncached, for get_stock_price to retry individually.
+        """
+        window = PRICE_LOOKUP_WINDOWS[0]
+        start_date = (min(dates) - timedelta(days=window)).strftime('%Y-%m-%d')
+        end_date = (max(dates) + timedelta(days=window + 1)).strftime('%Y-%m-%d')
+        try:
+            hist = self._get_ticker(symbol).history(start=start_date, end=end_date)
+        except Exception as e:
+            print(f"Error fetching stock prices for {symbol} from {start_date} to {end_date}: {e}")
+            return
+        if hist.empty:
+            return
+
+        hist_days, closes = self._store_history(symbol, hist)
+        for date in dates:
+            cache_key = (symbol, date.strftime('%Y-%m-%d'))
+            if cache_key in self._price_cache:
+                continue
+            nearest = np.abs((hist_days - pd.Timestamp(date.date())).days).min()
+            if nearest <= window:
+                self._price_cache[cache_key] = self._closest_close(symbol, date, hist_days, closes, window)
+
+    def prefetch_stock_prices(self, symbol: str, dates: List[datetime], max_workers: int = 16) -> Dict[datetime, float]:
+        """
+        Fetch prices for many dates up front.
+
+        Dates not already cached are covered by one history request spanning
+        all of them. Any stragglers (long market closures, failed requests)
+        fall back to individual lookups on a thread pool. Results land in the
+        price cache, making later get_stock_price() calls for the same dates free.
+        """
+        unique_dates = {d for d in dates if d is not None}
+        if not unique_dates:
+            return {}
+
+        missing = []
+        for d in unique_dates:
+            cache_key = (symbol, d.strftime('%Y-%m-%d'))
+            if cache_key in self._price_cache:
+                continue
+            price = self._read_cached_price(symbol, cache_key[1])
+            if price is None:
+                missing.append(d)
+            else:
+                self._price_cache[cache_key] = price
+        if missing:
+            self._fetch_price_range(symbol, missing)
+
+        leftovers = [d for d in missing if (symbol, d.strftime('%Y-%m-%d')) not in self._price_cache]
+        if leftovers:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(leftovers))) as ex:
+                list(ex.map(lambda d: self.get_stock_price(symbol, d), leftovers))
+
+        return {d: self.get_stock_price(symbol, d) for d in unique_dates}
+
     def load_stock_data(self, csv_file: str) -> pd.DataFrame:
         """Load and parse the stock CSV data."""
         df = pd.read_csv(csv_file)
@@ -542,44 +841,48 @@ class TaxCalculator:
         if first_col != 'Record Type':
             df = df.rename(columns={first_col: 'Record Type'})
 
-        # Clean up the dataframe
-        df = df.dropna(how='all')  # Remove empty rows
-        df = df[df['Record Type'].notna()]  # Remove rows with no data
-        df = df[df['Record Type'] != 'Overall Total']  # Remove summary row
+        # Clean up the dataframe with a single row filter, so parsing below only
+        # touches rows that are kept: drop empty rows, the summary row, rows
+        # with no acquisition date and rows with invalid quantities
+        qty = pd.to_numeric(df['Sellable Qty.'], errors='coerce')
+        keep = (
+            df['Record Type'].notna()
+            & (df['Record Type'] != 'Overall Total')
+            & df['Date Acquired'].notna()
+            & (qty > 0)
+        )
+        df = df.loc[keep].copy()
+        df['Sellable Qty.'] = qty[keep]
 
         # Parse dates
-        df['Date Acquired'] = df['Date Acquired'].apply(self.parse_date)
-        df = df[df['Date Acquired'].notna()]  # Remove rows with invalid dates
+        df['Date Acquired'] = self.parse_date_column(df['Date Acquired'])
+        if df['Date Acquired'].isna().any():
+            df = df[df['Date Acquired'].notna()]  # Remove rows with blank dates
 
         # Parse optional sale columns (backward compatible)
         if 'Date Sold' in df.columns:
-            df['Date Sold'] = df['Date Sold'].apply(
-                lambda x: self.parse_date(x) if pd.notna(x) and str(x).strip() != '' else None
-            )
+            df['Date Sold'] = self.parse_date_column(df['Date Sold'])
         else:
-            df['Date Sold'] = None
+            df['Date Sold'] = pd.NaT
 
         if 'Sale Price' in df.columns:
-            df['Sale Price'] = df['Sale Price'].apply(
-                lambda x: self.parse_currency(str(x)) if pd.notna(x) and str(x).strip() != '' else 0.0
-            )
+            df['Sale Price'] = self.parse_currency_column(df['Sale Price'])
         else:
             df['Sale Price'] = 0.0
 
         # Parse numeric values
-        df['Sellable Qty.'] = pd.to_numeric(df['Sellable Qty.'], errors='coerce')
-        df['Expected Gain/Loss'] = df['Expected Gain/Loss'].apply(self.parse_currency)
-        df['Est. Market Value'] = df['Est. Market Value'].apply(self.parse_currency)
-
-        # Remove rows with invalid quantities
-        df = df[df['Sellable Qty.'] > 0]
+        df['Expected Gain/Loss'] = self.parse_currency_column(df['Expected Gain/Loss'])
+        df['Est. Market Value'] = self.parse_currency_column(df['Est. Market Value'])
 
         # Classify stock type
-        df['Stock_Type'] = df['Plan Type'].apply(self.classify_stock_type)
+        df['Stock_Type'] = pd.Categorical(df['Plan Type'].map(self.classify_stock_type),
+                                          categories=STOCK_TYPES)
 
         return df
     
-    def classify_stock_type(self, plan_type: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def classify_stock_type(plan_type: str) -> str:
         """Classify whether the stock is RSU or ESPP."""
         if pd.isna(plan_type):
             return 'Unknown'
@@ -592,9 +895,28 @@ class TaxCalculator:
         else:
             return 'Unknown'
     
+    def _resolve_rates(self, ordinary_income: float, marginal_rate: Optional[float],
+                       capital_gains_rate: Optional[float]) -> Tuple[float, float]:
+        """Fill in whichever of the two rates the caller did not supply."""
+        if marginal_rate is None:
+            marginal_rate = self.calculate_marginal_tax_rate(ordinary_income)
+        if capital_gains_rate is None:
+            capital_gains_rate = self.calculate_capital_gains_rate(ordinary_income)
+        return marginal_rate, capital_gains_rate
+
     def calculate_rsu_taxes(self, row: pd.Series, sold_date: datetime, 
-                           sold_price: float, ordinary_income: float) -> Dict:
-        """Calculate taxes for RSU transactions."""
+                           sold_price: float, ordinary_income: float,
+                           marginal_rate: Optional[float] = None,
+                           capital_gains_rate: Optional[float] = None) -> Dict:
+        """
+        Calculate taxes for RSU transactions.
+
+        marginal_rate / capital_gains_rate may be passed in by callers that
+        process many rows at the same ordinary income; otherwise they are
+        looked up from ordinary_income.
+        """
+        marginal_rate, capital_gains_rate = self._resolve_rates(
+            ordinary_income, marginal_rate, capital_gains_rate)
         acquired_date = row['Date Acquired']
         shares = row['Sellable Qty.']
         
@@ -617,10 +939,10 @@ class TaxCalculator:
         
         # Calculate tax
         if is_long_term_holding:
-            tax_rate = self.calculate_capital_gains_rate(ordinary_income)
+            tax_rate = capital_gains_rate
             tax_type = 'Long Term Capital Gains'
         else:
-            tax_rate = self.calculate_marginal_tax_rate(ordinary_income)
+            tax_rate = marginal_rate
             tax_type = 'Short Term Capital Gains (Ordinary Income)'
         
         tax_amount = max(0, total_gain * tax_rate)  # No negative taxes
@@ -642,8 +964,12 @@ class TaxCalculator:
         }
     
     def calculate_espp_taxes(self, row: pd.Series, sold_date: datetime, 
-                            sold_price: float, ordinary_income: float) -> Dict:
-        """Calculate taxes for ESPP transactions."""
+                            sold_price: float, ordinary_income: float,
+                            marginal_rate: Optional[float] = None,
+                            capital_gains_rate: Optional[float] = None) -> Dict:
+        """Calculate taxes for ESPP transactions. Rate arguments as in calculate_rsu_taxes."""
+        marginal_rate, capital_gains_rate = self._resolve_rates(
+            ordinary_income, marginal_rate, capital_gains_rate)
         purchase_date = row['Date Acquired']
         shares = row['Sellable Qty.']
         
@@ -680,8 +1006,8 @@ class TaxCalculator:
             capital_gain_portion = max(0, total_gain - ordinary_income_portion)
             
             # Tax calculation
-            ordinary_tax = ordinary_income_portion * self.calculate_marginal_tax_rate(ordinary_income)
-            capital_gains_tax = capital_gain_portion * self.calculate_capital_gains_rate(ordinary_income)
+            ordinary_tax = ordinary_income_portion * marginal_rate
+            capital_gains_tax = capital_gain_portion * capital_gains_rate
             total_tax = ordinary_tax + capital_gains_tax
             tax_type = 'Qualifying ESPP'
             
@@ -694,15 +1020,15 @@ class TaxCalculator:
             capital_gain_portion = max(0, total_gain - ordinary_income_portion)
             
             # Tax calculation
-            ordinary_tax = ordinary_income_portion * self.calculate_marginal_tax_rate(ordinary_income)
+            ordinary_tax = ordinary_income_portion * marginal_rate
             
             # Capital gains tax (short or long term based on holding period from purchase)
             is_long_term_holding = self.is_long_term(purchase_date, sold_date)
             if is_long_term_holding:
-                capital_gains_tax = capital_gain_portion * self.calculate_capital_gains_rate(ordinary_income)
+                capital_gains_tax = capital_gain_portion * capital_gains_rate
                 tax_type = 'Disqualifying ESPP (LT Capital Gains)'
             else:
-                capital_gains_tax = capital_gain_portion * self.calculate_marginal_tax_rate(ordinary_income)
+                capital_gains_tax = capital_gain_portion * marginal_rate
                 tax_type = 'Disqualifying ESPP (ST Capital Gains)'
             
             total_tax = ordinary_tax + capital_gains_tax
@@ -726,6 +1052,58 @@ class TaxCalculator:
             'capital_gain_portion': capital_gain_portion
         }
     
+    def calculate_espp_taxes_vectorized(self, offer_dates: pd.Series, purchase_dates: pd.Series,
+                                        sold_dates: pd.Series, offer_prices: np.ndarray,
+                                        purchase_date_prices: np.ndarray, shares: np.ndarray,
+                                        sold_prices: np.ndarray, ordinary_income: float,
+                                        marginal_rate: Optional[float] = None,
+                                        capital_gains_rate: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        Array version of calculate_espp_taxes for a whole slice of ESPP lots.
+
+        Prices must already be fetched. Returns a dict of per-lot arrays keyed
+        like the calculate_espp_taxes result (acquisition_price, proceeds,
+        total_gain, is_qualifying, is_long_term, ordinary_income_portion,
+        capital_gain_portion, tax_amount, tax_type).
+        """
+        marginal_rate, capital_gains_rate = self._resolve_rates(
+            ordinary_income, marginal_rate, capital_gains_rate)
+
+        # ESPP purchase price is 85% of the lower of offer price or purchase date price
+        lower_price = np.minimum(offer_prices, purchase_date_prices)
+        espp_purchase_price = lower_price * 0.85
+        proceeds = shares * sold_prices
+        total_gain = proceeds - espp_purchase_price * shares
+
+        holding_days = (sold_dates - purchase_dates).dt.days.to_numpy()
+        is_long_term_holding = holding_days > 365
+        days_from_offer = (sold_dates - offer_dates).dt.days.to_numpy()
+        is_qualifying = (days_from_offer >= 730) & (holding_days >= 365)
+
+        # Qualifying discount is based on the lower price, disqualifying on FMV
+        # at purchase; the remainder of the gain is capital gain
+        discount_amount = np.where(is_qualifying, lower_price - espp_purchase_price,
+                                   purchase_date_prices - espp_purchase_price) * shares
+        ordinary_portion = np.where(is_qualifying, np.minimum(discount_amount, total_gain), discount_amount)
+        capital_portion = np.maximum(0, total_gain - ordinary_portion)
+        capital_rate = np.where(is_qualifying | is_long_term_holding, capital_gains_rate, marginal_rate)
+
+        return {
+            'acquisition_price': espp_purchase_price,
+            'proceeds': proceeds,
+            'total_gain': total_gain,
+            'is_qualifying': is_qualifying,
+            'is_long_term': is_qualifying | is_long_term_holding,
+            'ordinary_income_portion': ordinary_portion,
+            'capital_gain_portion': capital_portion,
+            'tax_amount': ordinary_portion * marginal_rate + capital_portion * capital_rate,
+            'tax_type': np.select(
+                [is_qualifying, is_long_term_holding],
+                ['Qualifying ESPP', 'Disqualifying ESPP (LT Capital Gains)'],
+                'Disqualifying ESPP (ST Capital Gains)',
+            ),
+        }
+
     def calculate_all_taxes(self, csv_file: str, ordinary_income: float,
                            sold_date: Optional[datetime] = None,
                            sold_only: bool = False) -> List[Dict]:
@@ -744,71 +1122,188 @@ class TaxCalculator:
         # Load stock data
         df = self.load_stock_data(csv_file)
 
+        has_sale = df['Date Sold'].notna()
+        keep = df['Stock_Type'].isin(['RSU', 'ESPP'])
+        if sold_only:
+            keep &= has_sale  # Skip unsold rows when only processing actual sales
+        df = df[keep]
+        has_sale = has_sale[keep]
+
+        is_rsu = (df['Stock_Type'] == 'RSU').to_numpy()
+        is_espp = ~is_rsu
+        has_espp = bool(is_espp.any())
+        acquired = pd.to_datetime(df['Date Acquired'])
+        if has_espp:
+            offer_dates = self.get_tesla_offer_dates(acquired).where(is_espp)
+        else:
+            # RSU-only portfolio: no offer dates to infer or price
+            offer_dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        needs_sale_price = has_sale & (df['Sale Price'] == 0.0)
+
+        # Fetch every price the calculation needs in parallel up front
+        needed_dates = list(acquired) + list(offer_dates.dropna()) + list(df.loc[needs_sale_price, 'Date Sold'])
+        if not sold_only:
+            needed_dates.append(sold_date)
+        prices = self.prefetch_stock_prices('TSLA', needed_dates)
+
         # Get default Tesla stock price for rows without a specific sale price
         default_sold_price = None
         if not sold_only:
-            default_sold_price = self.get_stock_price('TSLA', sold_date)
+            default_sold_price = prices.get(sold_date, 0.0)
             if default_sold_price == 0:
                 print(f"Warning: Could not fetch Tesla stock price for {sold_date}. Using current price.")
                 default_sold_price = self.get_stock_price('TSLA', datetime.now())
 
-        results = []
+        # Per-row sale date and price
+        row_sold_date = pd.to_datetime(df['Date Sold'].where(has_sale, sold_date))
+        row_sold_price = df['Sale Price'].where(has_sale, default_sold_price).astype(float)
+        row_sold_price = row_sold_price.mask(needs_sale_price, df['Date Sold'].map(prices))
 
-        for index, row in df.iterrows():
-            try:
-                # Determine sale date and price for this row
-                row_has_sale = row.get('Date Sold') is not None and pd.notna(row.get('Date Sold'))
+        # RSU: FMV at vest. ESPP: FMV on the purchase date.
+        acquired_price = acquired.map(prices).to_numpy(dtype=float)
+        offer_price = offer_dates.map(prices).to_numpy(dtype=float)
 
-                if sold_only and not row_has_sale:
-                    continue  # Skip unsold rows when only processing actual sales
+        shares = df['Sellable Qty.'].to_numpy(dtype=float)
+        sold_price = row_sold_price.to_numpy(dtype=float)
 
-                if row_has_sale:
-                    row_sold_date = row['Date Sold']
-                    row_sold_price = row.get('Sale Price', 0.0)
-                    if row_sold_price == 0.0:
-                        row_sold_price = self.get_stock_price('TSLA', row_sold_date)
-                else:
-                    row_sold_date = sold_date
-                    row_sold_price = default_sold_price
-
-                if row['Stock_Type'] == 'RSU':
-                    result = self.calculate_rsu_taxes(row, row_sold_date, row_sold_price, ordinary_income)
-                elif row['Stock_Type'] == 'ESPP':
-                    result = self.calculate_espp_taxes(row, row_sold_date, row_sold_price, ordinary_income)
-                else:
-                    continue
+        marginal_rate = self.calculate_marginal_tax_rate(ordinary_income)
+        capital_gains_rate = self.calculate_capital_gains_rate(ordinary_income)
 
-                # Skip if calculation failed (couldn't get historical prices)
-                if result is None:
-                    print(f"Skipping row {index} due to missing price data")
-                    continue
+        # RSU: basis is FMV at vest and all gain is capital gain
+        proceeds = shares * sold_price
+        total_gain = proceeds - acquired_price * shares
+        is_long_term_holding = (row_sold_date - acquired).dt.days.to_numpy() > 365
+        rsu_tax_rate = np.where(is_long_term_holding, capital_gains_rate, marginal_rate)
+        rsu_tax = np.maximum(0, total_gain * rsu_tax_rate)
+        rsu_tax_type = np.where(is_long_term_holding, 'Long Term Capital Gains',
+                                'Short Term Capital Gains (Ordinary Income)')
+
+        # ESPP rows are computed together on their own slice
+        if has_espp:
+            espp_rows = np.flatnonzero(is_espp)
+            espp = self.calculate_espp_taxes_vectorized(
+                offer_dates.iloc[espp_rows], acquired.iloc[espp_rows], row_sold_date.iloc[espp_rows],
+                offer_price[espp_rows], acquired_price[espp_rows], shares[espp_rows], sold_price[espp_rows],
+                ordinary_income, marginal_rate, capital_gains_rate,
+            )
+            espp_pos = np.cumsum(is_espp) - 1  # Row position -> position within the ESPP slice
 
-                # Add additional info
-                result['grant_number'] = row.get('Grant Number', 'N/A')
-                result['original_tax_status'] = row.get('Tax Status', 'N/A')
-                result['actually_sold'] = row_has_sale
+        # Skip rows whose historical prices could not be fetched
+        missing_price = (acquired_price == 0) | (is_espp & (offer_price == 0))
 
-                results.append(result)
+        # tolist() hands back plain Python values, as iterrows did
+        grant_numbers = df['Grant Number'].tolist() if 'Grant Number' in df.columns else ['N/A'] * len(df)
+        tax_statuses = df['Tax Status'].tolist() if 'Tax Status' in df.columns else ['N/A'] * len(df)
 
-            except Exception as e:
-                print(f"Error processing row {index}: {e}")
+        results = []
+        for i, index in enumerate(df.index):
+            if missing_price[i]:
+                print(f"Skipping row {index} due to missing price data")
                 continue
 
+            if is_rsu[i]:
+                result = {
+                    'stock_type': 'RSU',
+                    'acquired_date': acquired.iat[i],
+                    'shares': shares[i],
+                    'acquisition_price': acquired_price[i],
+                    'sold_price': sold_price[i],
+                    'proceeds': proceeds[i],
+                    'total_gain': total_gain[i],
+                    'is_long_term': bool(is_long_term_holding[i]),
+                    'tax_type': str(rsu_tax_type[i]),
+                    'tax_rate': rsu_tax_rate[i],
+                    'tax_amount': rsu_tax[i],
+                    'ordinary_income_portion': 0,  # RSUs don't have ordinary income portion at sale
+                    'capital_gain_portion': total_gain[i],  # For RSUs, all gain is capital gain
+                }
+            else:
+                j = espp_pos[i]
+                result = {
+                    'stock_type': 'ESPP',
+                    'acquired_date': acquired.iat[i],
+                    'offer_date': offer_dates.iat[i],
+                    'offer_price': offer_price[i],
+                    'purchase_date_price': acquired_price[i],
+                    'shares': shares[i],
+                    'acquisition_price': espp['acquisition_price'][j],
+                    'sold_price': sold_price[i],
+                    'proceeds': espp['proceeds'][j],
+                    'total_gain': espp['total_gain'][j],
+                    'is_qualifying': bool(espp['is_qualifying'][j]),
+                    'is_long_term': bool(espp['is_long_term'][j]),
+                    'tax_type': str(espp['tax_type'][j]),
+                    'tax_amount': espp['tax_amount'][j],
+                    'ordinary_income_portion': espp['ordinary_income_portion'][j],
+                    'capital_gain_portion': espp['capital_gain_portion'][j],
+                }
+
+            # Add additional info
+            result['grant_number'] = grant_numbers[i]
+            result['original_tax_status'] = tax_statuses[i]
+            result['actually_sold'] = bool(has_sale.iat[i])
+
+            results.append(result)
+
         return results
     
+    # Per-transaction report blocks, formatted once per row with str.format
+    _RSU_REPORT_TEMPLATE = ''.join([
+        "Grant: {grant_number}\n",
+        "  Acquired: {acquired_date:%Y-%m-%d}\n",
+        "  Shares: {shares:.2f}\n",
+        "  Acquisition Price: ${acquisition_price:.2f}\n",
+        "  Sold Price: ${sold_price:.2f}\n",
+        "  Proceeds: ${proceeds:,.2f}\n",
+        "  Total Gain: ${total_gain:,.2f}\n",
+        "  Holding Period: {holding_period}\n",
+        "  Tax Type: {tax_type}\n",
+        "  Tax Rate: {tax_rate:.1%}\n",
+        "  Tax Amount: ${tax_amount:,.2f}\n",
+        "\n",
+    ])
+
+    _ESPP_REPORT_TEMPLATE = ''.join([
+        "Grant: {grant_number}\n",
+        "  Offer Date: {offer_date:%Y-%m-%d}\n",
+        "  Purchase Date: {acquired_date:%Y-%m-%d}\n",
+        "  Offer Price: ${offer_price:.2f}\n",
+        "  Purchase Date Price: ${purchase_date_price:.2f}\n",
+        "  ESPP Purchase Price (15% discount): ${acquisition_price:.2f}\n",
+        "  Shares: {shares:.2f}\n",
+        "  Sold Price: ${sold_price:.2f}\n",
+        "  Proceeds: ${proceeds:,.2f}\n",
+        "  Total Gain: ${total_gain:,.2f}\n",
+        "  Disposition: {disposition}\n",
+        "  Ordinary Income: ${ordinary_income_portion:,.2f}\n",
+        "  Tax Type: {tax_type}\n",
+        "  Tax Amount: ${tax_amount:,.2f}\n",
+        "\n",
+    ])
+
+    # One row of the liability report's stock transaction table
+    _STOCK_DETAIL_ROW_TEMPLATE = (
+        "    {stock_type:<6} {acquired_date:%Y-%m-%d}   {shares:>8.2f} ${total_gain:>13,.2f} {tax_type:<20}"
+    )
+
     def generate_report(self, results: List[Dict], ordinary_income: float, 
                        sold_date: datetime) -> str:
         """Generate a comprehensive tax report."""
-        report = []
-        report.append("=" * 80)
-        report.append("TESLA STOCK TAX CALCULATION REPORT")
-        report.append("=" * 80)
-        report.append(f"Report Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        report.append(f"Ordinary Income: ${ordinary_income:,.2f}")
-        report.append(f"Sale Date: {sold_date.strftime('%Y-%m-%d')}")
-        report.append(f"Marginal Tax Rate: {self.calculate_marginal_tax_rate(ordinary_income):.1%}")
-        report.append(f"Capital Gains Rate: {self.calculate_capital_gains_rate(ordinary_income):.1%}")
-        report.append("")
+        buf = io.StringIO()
+
+        def line(text: str = "") -> None:
+            buf.write(text)
+            buf.write("\n")
+
+        line("=" * 80)
+        line("TESLA STOCK TAX CALCULATION REPORT")
+        line("=" * 80)
+        line(f"Report Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        line(f"Ordinary Income: ${ordinary_income:,.2f}")
+        line(f"Sale Date: {sold_date.strftime('%Y-%m-%d')}")
+        line(f"Marginal Tax Rate: {self.calculate_marginal_tax_rate(ordinary_income):.1%}")
+        line(f"Capital Gains Rate: {self.calculate_capital_gains_rate(ordinary_income):.1%}")
+        line()
         
         # Summary statistics
         total_shares = sum(r['shares'] for r in results)
@@ -817,132 +1312,105 @@ class TaxCalculator:
         total_taxes = sum(r['tax_amount'] for r in results)
         total_ordinary_income = sum(r.get('ordinary_income_portion', 0) for r in results)
         
-        report.append("SUMMARY")
-        report.append("-" * 40)
-        report.append(f"Total Shares: {total_shares:.2f}")
-        report.append(f"Total Proceeds: ${total_proceeds:,.2f}")
-        report.append(f"Total Gains: ${total_gains:,.2f}")
-        report.append(f"Total Ordinary Income: ${total_ordinary_income:,.2f}")
-        report.append(f"Total Tax Due: ${total_taxes:,.2f}")
-        report.append(f"Effective Tax Rate: {total_taxes/total_gains*100:.2f}%" if total_gains > 0 else "N/A")
-        report.append("")
+        line("SUMMARY")
+        line("-" * 40)
+        line(f"Total Shares: {total_shares:.2f}")
+        line(f"Total Proceeds: ${total_proceeds:,.2f}")
+        line(f"Total Gains: ${total_gains:,.2f}")
+        line(f"Total Ordinary Income: ${total_ordinary_income:,.2f}")
+        line(f"Total Tax Due: ${total_taxes:,.2f}")
+        line(f"Effective Tax Rate: {total_taxes/total_gains*100:.2f}%" if total_gains > 0 else "N/A")
+        line()
         
         # Detailed breakdown
-        report.append("DETAILED BREAKDOWN")
-        report.append("-" * 80)
+        line("DETAILED BREAKDOWN")
+        line("-" * 80)
         
         # Group by stock type
         rsu_results = [r for r in results if r['stock_type'] == 'RSU']
         espp_results = [r for r in results if r['stock_type'] == 'ESPP']
         
         if rsu_results:
-            report.append("\nRSU TRANSACTIONS:")
-            report.append("=" * 50)
+            line("\nRSU TRANSACTIONS:")
+            line("=" * 50)
             for r in rsu_results:
-                report.append(f"Grant: {r.get('grant_number', 'N/A')}")
-                report.append(f"  Acquired: {r['acquired_date'].strftime('%Y-%m-%d')}")
-                report.append(f"  Shares: {r['shares']:.2f}")
-                report.append(f"  Acquisition Price: ${r['acquisition_price']:.2f}")
-                report.append(f"  Sold Price: ${r['sold_price']:.2f}")
-                report.append(f"  Proceeds: ${r['proceeds']:,.2f}")
-                report.append(f"  Total Gain: ${r['total_gain']:,.2f}")
-                report.append(f"  Holding Period: {'Long Term' if r['is_long_term'] else 'Short Term'}")
-                report.append(f"  Tax Type: {r['tax_type']}")
-                report.append(f"  Tax Rate: {r['tax_rate']:.1%}")
-                report.append(f"  Tax Amount: ${r['tax_amount']:,.2f}")
-                report.append("")
+                buf.write(self._RSU_REPORT_TEMPLATE.format(**{
+                    **r,
+                    'grant_number': r.get('grant_number', 'N/A'),
+                    'holding_period': 'Long Term' if r['is_long_term'] else 'Short Term',
+                }))
         
         if espp_results:
-            report.append("\nESPP TRANSACTIONS:")
-            report.append("=" * 50)
+            line("\nESPP TRANSACTIONS:")
+            line("=" * 50)
             for r in espp_results:
-                report.append(f"Grant: {r.get('grant_number', 'N/A')}")
-                report.append(f"  Offer Date: {r['offer_date'].strftime('%Y-%m-%d')}")
-                report.append(f"  Purchase Date: {r['acquired_date'].strftime('%Y-%m-%d')}")
-                report.append(f"  Offer Price: ${r.get('offer_price', 0):.2f}")
-                report.append(f"  Purchase Date Price: ${r.get('purchase_date_price', 0):.2f}")
-                report.append(f"  ESPP Purchase Price (15% discount): ${r['acquisition_price']:.2f}")
-                report.append(f"  Shares: {r['shares']:.2f}")
-                report.append(f"  Sold Price: ${r['sold_price']:.2f}")
-                report.append(f"  Proceeds: ${r['proceeds']:,.2f}")
-                report.append(f"  Total Gain: ${r['total_gain']:,.2f}")
-                report.append(f"  Disposition: {'Qualifying' if r['is_qualifying'] else 'Disqualifying'}")
-                report.append(f"  Ordinary Income: ${r['ordinary_income_portion']:,.2f}")
-                report.append(f"  Tax Type: {r['tax_type']}")
-                report.append(f"  Tax Amount: ${r['tax_amount']:,.2f}")
-                report.append("")
+                buf.write(self._ESPP_REPORT_TEMPLATE.format(**{
+                    **r,
+                    'grant_number': r.get('grant_number', 'N/A'),
+                    'offer_price': r.get('offer_price', 0),
+                    'purchase_date_price': r.get('purchase_date_price', 0),
+                    'disposition': 'Qualifying' if r['is_qualifying'] else 'Disqualifying',
+                }))
         
         # Tax planning notes
-        report.append("\nTAX PLANNING NOTES:")
-        report.append("=" * 50)
-        report.append("• This calculation is based on 2025 federal tax brackets")
-        report.append("• State taxes are not included in this calculation")
-        report.append("• For ESPP, qualifying vs disqualifying disposition rules have been applied")
-        report.append("• Consult a tax professional for complex situations")
-        report.append("• Consider timing of sales to optimize tax efficiency")
-        report.append("")
-        
-        return "\n".join(report)
+        line("\nTAX PLANNING NOTES:")
+        line("=" * 50)
+        line("• This calculation is based on 2025 federal tax brackets")
+        line("• State taxes are not included in this calculation")
+        line("• For ESPP, qualifying vs disqualifying disposition rules have been applied")
+        line("• Consult a tax professional for complex situations")
+        line("• Consider timing of sales to optimize tax efficiency")
+        
+        return buf.getvalue()
     
+    def ensure_output_dir(self) -> str:
+        """Create the output directory on first use and return its path."""
+        if self.output_dir not in TaxCalculator._ready_output_dirs:
+            os.makedirs(self.output_dir, exist_ok=True)
+            TaxCalculator._ready_output_dirs.add(self.output_dir)
+        return self.output_dir
+
     def export_to_csv(self, results: List[Dict], filename: str) -> None:
         """Export calculation results to CSV format."""
         if not results:
             print("No results to export.")
             return
         
-        # Create outputs directory if it doesn't exist
-        output_dir = "outputs"
-        os.makedirs(output_dir, exist_ok=True)
-        
         # Add output directory to filename
-        csv_path = os.path.join(output_dir, filename)
-        
-        # Prepare data for CSV export
-        csv_data = []
-        for r in results:
-            row = {
-                'Stock_Type': r['stock_type'],
-                'Grant_Number': r.get('grant_number', 'N/A'),
-                'Acquired_Date': r['acquired_date'].strftime('%Y-%m-%d'),
-                'Shares': r['shares'],
-                'Acquisition_Price': r['acquisition_price'],
-                'Sold_Price': r['sold_price'],
-                'Proceeds': r['proceeds'],
-                'Total_Gain': r['total_gain'],
-                'Ordinary_Income_Portion': r.get('ordinary_income_portion', 0),
-                'Capital_Gain_Portion': r.get('capital_gain_portion', 0),
-                'Holding_Period': 'Long Term' if r['is_long_term'] else 'Short Term',
-                'Tax_Type': r['tax_type'],
-                'Tax_Rate': r.get('tax_rate', 0),
-                'Tax_Amount': r['tax_amount']
-            }
-            
-            # Add ESPP-specific fields
-            if r['stock_type'] == 'ESPP':
-                row['Offer_Date'] = r['offer_date'].strftime('%Y-%m-%d')
-                row['Offer_Price'] = r.get('offer_price', 0)
-                row['Purchase_Date_Price'] = r.get('purchase_date_price', 0)
-                row['Disposition_Type'] = 'Qualifying' if r['is_qualifying'] else 'Disqualifying'
-            else:
-                row['Offer_Date'] = ''
-                row['Offer_Price'] = ''
-                row['Purchase_Date_Price'] = ''
-                row['Disposition_Type'] = ''
-            
-            csv_data.append(row)
-        
-        # Create DataFrame and save to CSV
-        df = pd.DataFrame(csv_data)
-        
-        # Reorder columns for better readability
-        column_order = [
-            'Stock_Type', 'Grant_Number', 'Acquired_Date', 'Offer_Date', 'Offer_Price', 'Purchase_Date_Price',
-            'Shares', 'Acquisition_Price', 'Sold_Price', 'Proceeds',
-            'Total_Gain', 'Ordinary_Income_Portion', 'Capital_Gain_Portion', 'Holding_Period', 'Disposition_Type',
-            'Tax_Type', 'Tax_Rate', 'Tax_Amount'
-        ]
-        
-        df = df[column_order]
+        csv_path = os.path.join(self.ensure_output_dir(), filename)
+        
+        # Build each column in one pass over results; ESPP-only fields are blank for RSUs
+        is_espp = np.array([r['stock_type'] == 'ESPP' for r in results])
+
+        def espp_only(values):
+            return np.where(is_espp, pd.Series(values, dtype=object), '')
+
+        acquired_str = pd.to_datetime([r['acquired_date'] for r in results]).strftime('%Y-%m-%d')
+        offer_str = pd.to_datetime([r.get('offer_date') for r in results]).strftime('%Y-%m-%d')
+
+        # Enum-like text columns are stored as categoricals (small integer codes)
+        df = pd.DataFrame({
+            'Stock_Type': pd.Categorical([r['stock_type'] for r in results]),
+            'Grant_Number': [r.get('grant_number', 'N/A') for r in results],
+            'Acquired_Date': acquired_str,
+            'Offer_Date': espp_only(offer_str),
+            'Offer_Price': espp_only([r.get('offer_price', 0) for r in results]),
+            'Purchase_Date_Price': espp_only([r.get('purchase_date_price', 0) for r in results]),
+            'Shares': [r['shares'] for r in results],
+            'Acquisition_Price': [r['acquisition_price'] for r in results],
+            'Sold_Price': [r['sold_price'] for r in results],
+            'Proceeds': [r['proceeds'] for r in results],
+            'Total_Gain': [r['total_gain'] for r in results],
+            'Ordinary_Income_Portion': [r.get('ordinary_income_portion', 0) for r in results],
+            'Capital_Gain_Portion': [r.get('capital_gain_portion', 0) for r in results],
+            'Holding_Period': pd.Categorical(np.where([r['is_long_term'] for r in results],
+                                                     'Long Term', 'Short Term')),
+            'Disposition_Type': pd.Categorical(espp_only(np.where([r.get('is_qualifying', False) for r in results],
+                                                                  'Qualifying', 'Disqualifying'))),
+            'Tax_Type': pd.Categorical([r['tax_type'] for r in results]),
+            'Tax_Rate': [r.get('tax_rate', 0) for r in results],
+            'Tax_Amount': [r['tax_amount'] for r in results],
+        })
         df.to_csv(csv_path, index=False)
         print(f"Results exported to CSV: {csv_path}")
     
@@ -1081,54 +1549,59 @@ class TaxCalculator:
 
     def generate_tax_liability_report(self, liability: Dict, stock_results: List[Dict]) -> str:
         """Generate a Form 1040-style tax liability report."""
-        lines = []
-        lines.append("=" * 80)
+        buf = io.StringIO()
+
+        def line(text: str = "") -> None:
+            buf.write(text)
+            buf.write("\n")
+
+        line("=" * 80)
         status_labels = {
             'single': 'Single', 'mfj': 'Married Filing Jointly',
             'mfs': 'Married Filing Separately', 'hoh': 'Head of Household',
         }
-        lines.append(f"  {self.current_year} FEDERAL INCOME TAX LIABILITY ESTIMATE")
-        lines.append(f"  {status_labels.get(self.filing_status, self.filing_status)}")
-        lines.append("=" * 80)
-        lines.append(f"  Report Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        lines.append("")
+        line(f"  {self.current_year} FEDERAL INCOME TAX LIABILITY ESTIMATE")
+        line(f"  {status_labels.get(self.filing_status, self.filing_status)}")
+        line("=" * 80)
+        line(f"  Report Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        line()
 
         # Income section
-        lines.append("  INCOME")
-        lines.append("  " + "-" * 70)
-        lines.append(f"    W-2 Wages (Box 1):                          ${liability['w2_wages']:>14,.2f}")
+        line("  INCOME")
+        line("  " + "-" * 70)
+        line(f"    W-2 Wages (Box 1):                          ${liability['w2_wages']:>14,.2f}")
         if liability.get('interest_income', 0) > 0:
-            lines.append(f"    Interest Income (1099-INT):                  ${liability['interest_income']:>14,.2f}")
+            line(f"    Interest Income (1099-INT):                  ${liability['interest_income']:>14,.2f}")
         if liability['stock_ordinary_income'] > 0:
-            lines.append(f"    Stock Ordinary Income (ESPP discount):      ${liability['stock_ordinary_income']:>14,.2f}")
+            line(f"    Stock Ordinary Income (ESPP discount):      ${liability['stock_ordinary_income']:>14,.2f}")
         if liability['stock_short_term_gains'] > 0:
-            lines.append(f"    Short-Term Capital Gains:                    ${liability['stock_short_term_gains']:>14,.2f}")
+            line(f"    Short-Term Capital Gains:                    ${liability['stock_short_term_gains']:>14,.2f}")
         if liability.get('net_rental_income', 0) != 0:
             val = liability['net_rental_income']
             if val >= 0:
-                lines.append(f"    Net Rental Income (Schedule E):              ${val:>14,.2f}")
+                line(f"    Net Rental Income (Schedule E):              ${val:>14,.2f}")
             else:
-                lines.append(f"    Net Rental Loss (Schedule E):               (${abs(val):>13,.2f})")
-        lines.append(f"                                                 {'':>3}{'-' * 14}")
-        lines.append(f"    Total Ordinary Income:                       ${liability['total_ordinary_income']:>14,.2f}")
+                line(f"    Net Rental Loss (Schedule E):               (${abs(val):>13,.2f})")
+        line(f"                                                 {'':>3}{'-' * 14}")
+        line(f"    Total Ordinary Income:                       ${liability['total_ordinary_income']:>14,.2f}")
         if liability['total_long_term_gains'] > 0:
-            lines.append(f"    Long-Term Capital Gains:                     ${liability['total_long_term_gains']:>14,.2f}")
-        lines.append(f"                                                 {'':>3}{'-' * 14}")
-        lines.append(f"    Adjusted Gross Income (AGI):                 ${liability['agi']:>14,.2f}")
-        lines.append("")
+            line(f"    Long-Term Capital Gains:                     ${liability['total_long_term_gains']:>14,.2f}")
+        line(f"                                                 {'':>3}{'-' * 14}")
+        line(f"    Adjusted Gross Income (AGI):                 ${liability['agi']:>14,.2f}")
+        line()
 
         # Rental detail (if applicable)
         rental_detail = liability.get('rental_detail')
         if rental_detail:
             pct_label = f"{rental_detail['rental_pct']*100:.0f}%"
-            lines.append("  SCHEDULE E - RENTAL INCOME")
-            lines.append("  " + "-" * 70)
-            lines.append(f"    Rental Usage:                                {pct_label:>14}")
-            lines.append(f"    Rental Income:                               ${rental_detail['rental_income']:>14,.2f}")
+            line("  SCHEDULE E - RENTAL INCOME")
+            line("  " + "-" * 70)
+            line(f"    Rental Usage:                                {pct_label:>14}")
+            line(f"    Rental Income:                               ${rental_detail['rental_income']:>14,.2f}")
             if rental_detail.get('other_rental_income', 0) > 0:
-                lines.append(f"    Other Income:                                ${rental_detail['other_rental_income']:>14,.2f}")
-            lines.append(f"    Total Rental Income:                         ${rental_detail['total_income']:>14,.2f}")
-            lines.append(f"    Expenses ({pct_label} of property):")
+                line(f"    Other Income:                                ${rental_detail['other_rental_income']:>14,.2f}")
+            line(f"    Total Rental Income:                         ${rental_detail['total_income']:>14,.2f}")
+            line(f"    Expenses ({pct_label} of property):")
             exp = rental_detail['expenses']
             for key, label in [('mortgage_interest', 'Mortgage Interest'),
                                ('property_taxes', 'Property Taxes'),
@@ -1141,97 +1614,97 @@ class TaxCalculator:
                                ('depreciation', 'Depreciation')]:
                 val = exp.get(key, 0)
                 if val > 0:
-                    lines.append(f"      {label:<40}  (${val:>13,.2f})")
-            lines.append(f"                                                 {'':>3}{'-' * 14}")
-            lines.append(f"    Total Rental Expenses:                      (${rental_detail['total_expenses']:>13,.2f})")
-            lines.append(f"    Net Rental Income:                           ${rental_detail['net_rental_income']:>14,.2f}")
-            lines.append("")
+                    line(f"      {label:<40}  (${val:>13,.2f})")
+            line(f"                                                 {'':>3}{'-' * 14}")
+            line(f"    Total Rental Expenses:                      (${rental_detail['total_expenses']:>13,.2f})")
+            line(f"    Net Rental Income:                           ${rental_detail['net_rental_income']:>14,.2f}")
+            line()
 
         # Deductions
-        lines.append("  DEDUCTIONS")
-        lines.append("  " + "-" * 70)
+        line("  DEDUCTIONS")
+        line("  " + "-" * 70)
         itemized_detail = liability.get('itemized_detail')
         if itemized_detail and 'Itemized' in liability['deduction_type']:
-            lines.append(f"    Itemized Deductions (Schedule A):")
+            line(f"    Itemized Deductions (Schedule A):")
             if rental_detail:
-                lines.append(f"      Mortgage Interest (personal {(1-rental_detail['rental_pct'])*100:.0f}%):          ${itemized_detail['mortgage_interest']:>14,.2f}")
+                line(f"      Mortgage Interest (personal {(1-rental_detail['rental_pct'])*100:.0f}%):          ${itemized_detail['mortgage_interest']:>14,.2f}")
             else:
-                lines.append(f"      Mortgage Interest:                         ${itemized_detail['mortgage_interest']:>14,.2f}")
-            lines.append(f"      SALT (State tax + property tax):            ${itemized_detail['salt_deduction']:>14,.2f}")
+                line(f"      Mortgage Interest:                         ${itemized_detail['mortgage_interest']:>14,.2f}")
+            line(f"      SALT (State tax + property tax):            ${itemized_detail['salt_deduction']:>14,.2f}")
             if itemized_detail['salt_limited']:
-                lines.append(f"        (Capped at ${itemized_detail['salt_cap']:,.0f}; uncapped: ${itemized_detail['salt_uncapped']:>11,.2f})")
+                line(f"        (Capped at ${itemized_detail['salt_cap']:,.0f}; uncapped: ${itemized_detail['salt_uncapped']:>11,.2f})")
             if itemized_detail.get('mortgage_insurance', 0) > 0:
-                lines.append(f"      Mortgage Insurance Premium:                 ${itemized_detail['mortgage_insurance']:>14,.2f}")
+                line(f"      Mortgage Insurance Premium:                 ${itemized_detail['mortgage_insurance']:>14,.2f}")
             elif itemized_detail.get('mortgage_insurance_phased_out'):
-                lines.append(f"      Mortgage Insurance Premium:                           $0.00")
-                lines.append(f"        (Phased out for AGI > $110,000)")
-            lines.append(f"                                                 {'':>3}{'-' * 14}")
-            lines.append(f"    Total Itemized:                             (${itemized_detail['total_itemized']:>13,.2f})")
-            lines.append(f"    Standard Deduction Comparison:               (${self.standard_deduction:>13,.2f})")
-            lines.append(f"    -> Using {liability['deduction_type']}")
+                line(f"      Mortgage Insurance Premium:                           $0.00")
+                line(f"        (Phased out for AGI > $110,000)")
+            line(f"                                                 {'':>3}{'-' * 14}")
+            line(f"    Total Itemized:                             (${itemized_detail['total_itemized']:>13,.2f})")
+            line(f"    Standard Deduction Comparison:               (${self.standard_deduction:>13,.2f})")
+            line(f"    -> Using {liability['deduction_type']}")
         else:
-            lines.append(f"    {liability['deduction_type']} Deduction ({self.current_year}):              (${liability['deduction_amount']:>13,.2f})")
-        lines.append(f"                                                 {'':>3}{'-' * 14}")
-        lines.append(f"    Taxable Ordinary Income:                     ${liability['taxable_ordinary_income']:>14,.2f}")
+            line(f"    {liability['deduction_type']} Deduction ({self.current_year}):              (${liability['deduction_amount']:>13,.2f})")
+        line(f"                                                 {'':>3}{'-' * 14}")
+        line(f"    Taxable Ordinary Income:                     ${liability['taxable_ordinary_income']:>14,.2f}")
         if liability['taxable_ltcg'] > 0:
-            lines.append(f"    Taxable Long-Term Capital Gains:             ${liability['taxable_ltcg']:>14,.2f}")
-        lines.append(f"    Total Taxable Income:                        ${liability['total_taxable_income']:>14,.2f}")
-        lines.append("")
+            line(f"    Taxable Long-Term Capital Gains:             ${liability['taxable_ltcg']:>14,.2f}")
+        line(f"    Total Taxable Income:                        ${liability['total_taxable_income']:>14,.2f}")
+        line()
 
         # Ordinary income tax brackets
-        lines.append("  FEDERAL TAX CALCULATION")
-        lines.append("  " + "-" * 70)
-        lines.append("    Tax on Ordinary Income (Progressive):")
+        line("  FEDERAL TAX CALCULATION")
+        line("  " + "-" * 70)
+        line("    Tax on Ordinary Income (Progressive):")
         for b in liability['ordinary_tax_brackets']:
             rate_pct = f"{b['rate']*100:.0f}%"
-            lines.append(f"      {rate_pct:>4} on ${b['income_in_bracket']:>12,.2f}:                    ${b['tax_in_bracket']:>12,.2f}")
-        lines.append(f"                                                 {'':>3}{'-' * 14}")
-        lines.append(f"    Subtotal - Ordinary Income Tax:               ${liability['ordinary_tax']:>14,.2f}")
-        lines.append("")
+            line(f"      {rate_pct:>4} on ${b['income_in_bracket']:>12,.2f}:                    ${b['tax_in_bracket']:>12,.2f}")
+        line(f"                                                 {'':>3}{'-' * 14}")
+        line(f"    Subtotal - Ordinary Income Tax:               ${liability['ordinary_tax']:>14,.2f}")
+        line()
 
         # LTCG tax
         if liability['taxable_ltcg'] > 0:
-            lines.append("    Tax on Long-Term Capital Gains:")
+            line("    Tax on Long-Term Capital Gains:")
             for b in liability['ltcg_tax_brackets']:
                 rate_pct = f"{b['rate']*100:.0f}%"
-                lines.append(f"      {rate_pct:>4} on ${b['gains_in_bracket']:>12,.2f}:                    ${b['tax_in_bracket']:>12,.2f}")
-            lines.append(f"                                                 {'':>3}{'-' * 14}")
-            lines.append(f"    Subtotal - LTCG Tax:                         ${liability['ltcg_tax']:>14,.2f}")
-            lines.append("")
+                line(f"      {rate_pct:>4} on ${b['gains_in_bracket']:>12,.2f}:                    ${b['tax_in_bracket']:>12,.2f}")
+            line(f"                                                 {'':>3}{'-' * 14}")
+            line(f"    Subtotal - LTCG Tax:                         ${liability['ltcg_tax']:>14,.2f}")
+            line()
 
         # NIIT
         if liability['niit'] > 0:
-            lines.append(f"    Net Investment Income Tax (3.8%):             ${liability['niit']:>14,.2f}")
-            lines.append(f"      (Net investment income: ${liability.get('net_investment_income', 0):>11,.2f})")
-            lines.append("")
+            line(f"    Net Investment Income Tax (3.8%):             ${liability['niit']:>14,.2f}")
+            line(f"      (Net investment income: ${liability.get('net_investment_income', 0):>11,.2f})")
+            line()
 
-        lines.append(f"                                                 {'':>3}{'=' * 14}")
-        lines.append(f"    TOTAL FEDERAL TAX LIABILITY:                  ${liability['total_tax_liability']:>14,.2f}")
-        lines.append("")
+        line(f"                                                 {'':>3}{'=' * 14}")
+        line(f"    TOTAL FEDERAL TAX LIABILITY:                  ${liability['total_tax_liability']:>14,.2f}")
+        line()
 
         # Payments and withholdings
-        lines.append("  PAYMENTS & WITHHOLDINGS")
-        lines.append("  " + "-" * 70)
-        lines.append(f"    W-2 Federal Tax Withheld (Box 2):           (${liability['federal_tax_withheld']:>13,.2f})")
+        line("  PAYMENTS & WITHHOLDINGS")
+        line("  " + "-" * 70)
+        line(f"    W-2 Federal Tax Withheld (Box 2):           (${liability['federal_tax_withheld']:>13,.2f})")
         if liability['stock_tax_withheld'] > 0:
-            lines.append(f"    Stock Sale Withholding:                     (${liability['stock_tax_withheld']:>13,.2f})")
+            line(f"    Stock Sale Withholding:                     (${liability['stock_tax_withheld']:>13,.2f})")
         if liability['estimated_payments'] > 0:
-            lines.append(f"    Estimated Tax Payments:                     (${liability['estimated_payments']:>13,.2f})")
-        lines.append(f"                                                 {'':>3}{'-' * 14}")
-        lines.append(f"    Total Payments:                             (${liability['total_payments']:>13,.2f})")
-        lines.append("")
+            line(f"    Estimated Tax Payments:                     (${liability['estimated_payments']:>13,.2f})")
+        line(f"                                                 {'':>3}{'-' * 14}")
+        line(f"    Total Payments:                             (${liability['total_payments']:>13,.2f})")
+        line()
 
         # Result
-        lines.append("  " + "=" * 70)
+        line("  " + "=" * 70)
         if liability['net_tax_due'] > 0:
-            lines.append(f"    NET TAX DUE:                                 ${liability['net_tax_due']:>14,.2f}")
+            line(f"    NET TAX DUE:                                 ${liability['net_tax_due']:>14,.2f}")
         else:
-            lines.append(f"    REFUND:                                      ${liability['refund']:>14,.2f}")
-        lines.append("")
-        lines.append(f"    Effective Tax Rate:                           {liability['effective_tax_rate']:>13.1f}%")
-        lines.append(f"    Marginal Ordinary Rate:                       {liability['marginal_ordinary_rate']*100:>13.0f}%")
-        lines.append(f"    Marginal LTCG Rate:                           {liability['marginal_ltcg_rate']*100:>13.0f}%")
-        lines.append("")
+            line(f"    REFUND:                                      ${liability['refund']:>14,.2f}")
+        line()
+        line(f"    Effective Tax Rate:                           {liability['effective_tax_rate']:>13.1f}%")
+        line(f"    Marginal Ordinary Rate:                       {liability['marginal_ordinary_rate']*100:>13.0f}%")
+        line(f"    Marginal LTCG Rate:                           {liability['marginal_ltcg_rate']*100:>13.0f}%")
+        line()
 
         # Stock transaction detail
         if stock_results:
@@ -1240,42 +1713,39 @@ class TaxCalculator:
             if is_1099b:
                 # Show 1099-B summary with wash sale detail
                 summary = self.get_1099b_summary(stock_results)
-                lines.append("  1099-B SUMMARY")
-                lines.append("  " + "-" * 70)
-                lines.append(f"    {'':30} {'Short-Term':>16} {'Long-Term':>16} {'Total':>16}")
-                lines.append("    " + "-" * 64)
-                lines.append(f"    {'Lots':30} {summary['short_term']['count']:>16} {summary['long_term']['count']:>16} {summary['total_count']:>16}")
-                lines.append(f"    {'Shares':30} {summary['short_term']['shares']:>16.3f} {summary['long_term']['shares']:>16.3f} {summary['total_shares']:>16.3f}")
-                lines.append(f"    {'Proceeds':30} ${summary['short_term']['proceeds']:>14,.2f} ${summary['long_term']['proceeds']:>14,.2f} ${summary['total_proceeds']:>14,.2f}")
-                lines.append(f"    {'Cost Basis':30} ${summary['short_term']['cost_basis']:>14,.2f} ${summary['long_term']['cost_basis']:>14,.2f} ${summary['total_cost_basis']:>14,.2f}")
+                line("  1099-B SUMMARY")
+                line("  " + "-" * 70)
+                line(f"    {'':30} {'Short-Term':>16} {'Long-Term':>16} {'Total':>16}")
+                line("    " + "-" * 64)
+                line(f"    {'Lots':30} {summary['short_term']['count']:>16} {summary['long_term']['count']:>16} {summary['total_count']:>16}")
+                line(f"    {'Shares':30} {summary['short_term']['shares']:>16.3f} {summary['long_term']['shares']:>16.3f} {summary['total_shares']:>16.3f}")
+                line(f"    {'Proceeds':30} ${summary['short_term']['proceeds']:>14,.2f} ${summary['long_term']['proceeds']:>14,.2f} ${summary['total_proceeds']:>14,.2f}")
+                line(f"    {'Cost Basis':30} ${summary['short_term']['cost_basis']:>14,.2f} ${summary['long_term']['cost_basis']:>14,.2f} ${summary['total_cost_basis']:>14,.2f}")
                 if summary['total_wash_sale'] > 0:
-                    lines.append(f"    {'Wash Sale Disallowed':30} ${summary['short_term']['wash_sale']:>14,.2f} ${summary['long_term']['wash_sale']:>14,.2f} ${summary['total_wash_sale']:>14,.2f}")
-                    lines.append(f"    {'Realized Gain/Loss':30} ${summary['short_term']['raw_gain']:>14,.2f} ${summary['long_term']['raw_gain']:>14,.2f} ${summary['short_term']['raw_gain']+summary['long_term']['raw_gain']:>14,.2f}")
-                    lines.append(f"    {'Taxable Gain (adjusted)':30} ${summary['short_term']['taxable_gain']:>14,.2f} ${summary['long_term']['taxable_gain']:>14,.2f} ${summary['total_taxable_gain']:>14,.2f}")
+                    line(f"    {'Wash Sale Disallowed':30} ${summary['short_term']['wash_sale']:>14,.2f} ${summary['long_term']['wash_sale']:>14,.2f} ${summary['total_wash_sale']:>14,.2f}")
+                    line(f"    {'Realized Gain/Loss':30} ${summary['short_term']['raw_gain']:>14,.2f} ${summary['long_term']['raw_gain']:>14,.2f} ${summary['short_term']['raw_gain']+summary['long_term']['raw_gain']:>14,.2f}")
+                    line(f"    {'Taxable Gain (adjusted)':30} ${summary['short_term']['taxable_gain']:>14,.2f} ${summary['long_term']['taxable_gain']:>14,.2f} ${summary['total_taxable_gain']:>14,.2f}")
                 else:
-                    lines.append(f"    {'Gain/Loss':30} ${summary['short_term']['taxable_gain']:>14,.2f} ${summary['long_term']['taxable_gain']:>14,.2f} ${summary['total_taxable_gain']:>14,.2f}")
-                lines.append("")
+                    line(f"    {'Gain/Loss':30} ${summary['short_term']['taxable_gain']:>14,.2f} ${summary['long_term']['taxable_gain']:>14,.2f} ${summary['total_taxable_gain']:>14,.2f}")
+                line()
             else:
-                lines.append("  STOCK TRANSACTION DETAIL")
-                lines.append("  " + "-" * 70)
-                lines.append(f"    {'Type':<6} {'Acquired':<12} {'Shares':>8} {'Gain/Loss':>14} {'Tax Type':<20}")
-                lines.append("    " + "-" * 64)
-                for r in stock_results:
-                    acq_date = r['acquired_date'].strftime('%Y-%m-%d')
-                    gain = r['total_gain']
-                    lines.append(f"    {r['stock_type']:<6} {acq_date:<12} {r['shares']:>8.2f} ${gain:>13,.2f} {r['tax_type']:<20}")
-                lines.append("")
+                line("  STOCK TRANSACTION DETAIL")
+                line("  " + "-" * 70)
+                line(f"    {'Type':<6} {'Acquired':<12} {'Shares':>8} {'Gain/Loss':>14} {'Tax Type':<20}")
+                line("    " + "-" * 64)
+                buf.writelines(self._STOCK_DETAIL_ROW_TEMPLATE.format(**r) + "\n" for r in stock_results)
+                line()
 
         # Notes
-        lines.append("  NOTES")
-        lines.append("  " + "-" * 70)
-        lines.append(f"    * This is an estimate based on {self.current_year} federal tax brackets.")
-        lines.append("    * Does not account for AMT, tax credits, or other adjustments.")
-        lines.append(f"    * NIIT applies when MAGI > ${self.niit_threshold:,}.")
-        lines.append("    * Consult a tax professional for your actual filing.")
-        lines.append("=" * 80)
+        line("  NOTES")
+        line("  " + "-" * 70)
+        line(f"    * This is an estimate based on {self.current_year} federal tax brackets.")
+        line("    * Does not account for AMT, tax credits, or other adjustments.")
+        line(f"    * NIIT applies when MAGI > ${self.niit_threshold:,}.")
+        line("    * Consult a tax professional for your actual filing.")
+        buf.write("=" * 80)
 
-        return "\n".join(lines)
+        return buf.getvalue()
 
     def load_w2_data(self, csv_file: str) -> Dict:
         """
@@ -1329,53 +1799,77 @@ class TaxCalculator:
             Term, Date Sold, Date Acquired, Proceeds, Cost Basis,
             Wash Sale Disallowed, Gain Loss, Grant Number, Shares, Form 8949 Box
         """
-        df = pd.read_csv(csv_file)
-
         results = []
-        for _, row in df.iterrows():
-            is_long = str(row['Term']).strip().lower().startswith('long')
-            wash_sale = float(row.get('Wash Sale Disallowed', 0) or 0)
-            raw_gain = float(row['Gain Loss'])
-            # Tax-reportable gain = raw gain + wash sale disallowed
-            # (wash sale losses are added back, increasing taxable gain)
-            taxable_gain = raw_gain + wash_sale
-
-            # Parse dates
-            date_sold = datetime.strptime(str(row['Date Sold']).strip(), '%m/%d/%y')
-            date_acquired = datetime.strptime(str(row['Date Acquired']).strip(), '%m/%d/%y')
-
-            shares = float(row['Shares'])
-            proceeds = float(row['Proceeds'])
-            cost_basis = float(row['Cost Basis'])
-
-            result = {
-                'stock_type': 'RSU',
-                'acquired_date': date_acquired,
-                'sold_date': date_sold,
-                'shares': shares,
-                'acquisition_price': cost_basis / shares if shares > 0 else 0,
-                'sold_price': proceeds / shares if shares > 0 else 0,
-                'proceeds': proceeds,
-                'cost_basis': cost_basis,
-                'total_gain': taxable_gain,
-                'raw_gain': raw_gain,
-                'wash_sale_disallowed': wash_sale,
-                'is_long_term': is_long,
-                'tax_type': 'Long Term Capital Gains' if is_long else 'Short Term Capital Gains (Ordinary Income)',
-                'tax_rate': 0,  # Will be computed by total liability calculator
-                'tax_amount': 0,
-                'ordinary_income_portion': 0,
-                'capital_gain_portion': taxable_gain,
-                'grant_number': str(row.get('Grant Number', 'N/A')),
-                'form_8949_box': str(row.get('Form 8949 Box', '')),
-                'actually_sold': True,
-                'source': '1099-B',
-            }
-
-            results.append(result)
+        # Each lot is handled independently, so stream rows instead of building a DataFrame
+        with open(csv_file, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                results.append(self._parse_1099b_row(row))
 
         return results
 
+    @staticmethod
+    def _parse_1099b_amount(row: Dict[str, str], column: str) -> float:
+        """
+        Parse a 1099-B amount strictly: '$' and ',' are stripped and broker-style
+        parentheses mean negative, e.g. '(1,234.56)' -> -1234.56. Anything else
+        raises ValueError rather than silently becoming 0.
+        """
+        value = row[column]
+        text = _CURRENCY_RE.sub('', value or '')
+        negative = text.startswith('(') and text.endswith(')')
+        if negative:
+            text = text[1:-1]
+        try:
+            amount = float(text)
+        except ValueError:
+            raise ValueError(f"Invalid 1099-B amount in '{column}': {value!r}") from None
+        return -amount if negative else amount
+
+    def _parse_1099b_row(self, row: Dict[str, str]) -> Dict:
+        """Convert one 1099-B CSV row into a stock result dict."""
+        is_long = row['Term'].strip().lower().startswith('long')
+        # Wash Sale Disallowed is optional and usually blank; every other amount is required
+        wash_sale_cell = (row.get('Wash Sale Disallowed') or '').strip()
+        wash_sale = self._parse_1099b_amount(row, 'Wash Sale Disallowed') if wash_sale_cell else 0.0
+        raw_gain = self._parse_1099b_amount(row, 'Gain Loss')
+        # Tax-reportable gain = raw gain + wash sale disallowed
+        # (wash sale losses are added back, increasing taxable gain)
+        taxable_gain = raw_gain + wash_sale
+
+        # Parse dates
+        date_sold = datetime.strptime(row['Date Sold'].strip(), '%m/%d/%y')
+        date_acquired = datetime.strptime(row['Date Acquired'].strip(), '%m/%d/%y')
+
+        shares = self._parse_1099b_amount(row, 'Shares')
+        proceeds = self._parse_1099b_amount(row, 'Proceeds')
+        cost_basis = self._parse_1099b_amount(row, 'Cost Basis')
+
+        result = {
+            'stock_type': 'RSU',
+            'acquired_date': date_acquired,
+            'sold_date': date_sold,
+            'shares': shares,
+            'acquisition_price': cost_basis / shares if shares > 0 else 0,
+            'sold_price': proceeds / shares if shares > 0 else 0,
+            'proceeds': proceeds,
+            'cost_basis': cost_basis,
+            'total_gain': taxable_gain,
+            'raw_gain': raw_gain,
+            'wash_sale_disallowed': wash_sale,
+            'is_long_term': is_long,
+            'tax_type': 'Long Term Capital Gains' if is_long else 'Short Term Capital Gains (Ordinary Income)',
+            'tax_rate': 0,  # Will be computed by total liability calculator
+            'tax_amount': 0,
+            'ordinary_income_portion': 0,
+            'capital_gain_portion': taxable_gain,
+            'grant_number': (row.get('Grant Number') or 'N/A').strip(),
+            'form_8949_box': (row.get('Form 8949 Box') or '').strip(),
+            'actually_sold': True,
+            'source': '1099-B',
+        }
+
+        return result
+
     def get_1099b_summary(self, stock_results: List[Dict]) -> Dict:
         """
         Generate a summary of 1099-B stock results.
@@ -1383,20 +1877,37 @@ class TaxCalculator:
         Returns totals for short-term and long-term categories including
         proceeds, cost basis, wash sale adjustments, and gains.
         """
+        fields = ['proceeds', 'cost_basis', 'wash_sale', 'raw_gain', 'taxable_gain', 'shares', 'count']
         summary = {
-            'short_term': {'proceeds': 0, 'cost_basis': 0, 'wash_sale': 0, 'raw_gain': 0, 'taxable_gain': 0, 'shares': 0, 'count': 0},
-            'long_term': {'proceeds': 0, 'cost_basis': 0, 'wash_sale': 0, 'raw_gain': 0, 'taxable_gain': 0, 'shares': 0, 'count': 0},
+            'short_term': dict.fromkeys(fields, 0),
+            'long_term': dict.fromkeys(fields, 0),
         }
 
-        for r in stock_results:
-            key = 'long_term' if r.get('is_long_term', False) else 'short_term'
-            summary[key]['proceeds'] += r.get('proceeds', 0)
-            summary[key]['cost_basis'] += r.get('cost_basis', 0)
-            summary[key]['wash_sale'] += r.get('wash_sale_disallowed', 0)
-            summary[key]['raw_gain'] += r.get('raw_gain', r.get('total_gain', 0))
-            summary[key]['taxable_gain'] += r.get('total_gain', 0)
-            summary[key]['shares'] += r.get('shares', 0)
-            summary[key]['count'] += 1
+        if stock_results:
+            df = pd.DataFrame.from_records(stock_results)
+
+            def column(name: str) -> pd.Series:
+                if name not in df.columns:
+                    return pd.Series(0.0, index=df.index)
+                return df[name].fillna(0)
+
+            total_gain = column('total_gain')
+            lots = pd.DataFrame({
+                'proceeds': column('proceeds'),
+                'cost_basis': column('cost_basis'),
+                'wash_sale': column('wash_sale_disallowed'),
+                'raw_gain': df['raw_gain'].fillna(total_gain) if 'raw_gain' in df.columns else total_gain,
+                'taxable_gain': total_gain,
+                'shares': column('shares'),
+            })
+            is_long = column('is_long_term').astype(bool)
+            grouped = lots.groupby(is_long).sum()
+            counts = is_long.value_counts()
+
+            for flag, key in ((False, 'short_term'), (True, 'long_term')):
+                if flag in grouped.index:
+                    summary[key].update({k: float(v) for k, v in grouped.loc[flag].items()})
+                    summary[key]['count'] = int(counts[flag])
 
         summary['total_proceeds'] = summary['short_term']['proceeds'] + summary['long_term']['proceeds']
         summary['total_cost_basis'] = summary['short_term']['cost_basis'] + summary['long_term']['cost_basis']
@@ -1853,8 +2364,7 @@ def main():
         report = calculator.generate_report(results, args.income, sold_date)
         
         # Create outputs directory if it doesn't exist
-        output_dir = "outputs"
-        os.makedirs(output_dir, exist_ok=True)
+        output_dir = calculator.ensure_output_dir()
         
         if args.output:
             output_path = os.path.join(output_dir, args.output)
@@ -10,16 +10,35 @@ import os
 import sys
 import tempfile
 import shutil
-from datetime import datetime
+import functools
+import hashlib
+import json
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
 
 from flask import Flask, request, jsonify, render_template
+from werkzeug.http import http_date
+from werkzeug.utils import secure_filename
 
 from form_scanner import scan_form_multi
-from tax_app import build_tax_inputs
-from tax_calculator import TaxCalculator
-from projection_engine import project_full_year
-from form_parsers.vesting_parser import parse_vesting_xlsx
-from form_parsers.paystub_parser import parse_paystub
+from tax_app import build_tax_inputs, split_stock_gains
+from tax_calculator import SqliteCache, TaxCalculator
+
+try:
+    from waitress import serve
+    HAS_WAITRESS = True
+except ImportError:
+    HAS_WAITRESS = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 # When running inside a PyInstaller bundle, templates (and other data files)
 # are extracted to a temporary directory pointed to by sys._MEIPASS.
@@ -29,6 +48,239 @@ else:
     _base = os.path.dirname(os.path.abspath(__file__))
 
 app = Flask(__name__, template_folder=os.path.join(_base, 'templates'))
+# Scanned tax PDFs can be large; reject anything beyond this outright
+app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024
+
+# Copy uploads to disk in 1 MiB chunks (FileStorage.save uses 16 KiB)
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Linux tmpfs; uploads are staged here when it has space
+_SHM_DIR = '/dev/shm'
+
+# Current quotes for /stock_price: symbol -> (monotonic fetch time, price)
+_QUOTE_TTL_SECONDS = 60
+_QUOTE_CACHE_MAX = 512
+_quote_cache = {}
+_quote_cache_lock = threading.Lock()
+
+
+# PDF scanning is CPU-bound, so multi-file uploads are scanned in worker
+# processes. Created on first use so importing this module stays cheap.
+_scan_pool = None
+_scan_pool_lock = threading.Lock()
+
+
+def _get_scan_pool() -> ProcessPoolExecutor:
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is None:
+            # spawn rather than fork: forking while server threads hold locks
+            # can deadlock the child (spawn is already the Windows/macOS default)
+            _scan_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn')
+            )
+        return _scan_pool
+
+
+def _submit_scan(path: str, tax_year: int) -> Future:
+    """
+    Scan path in the worker pool. A pool whose worker died (e.g. out of memory
+    on a large OCR scan) stays broken, so it is replaced with a fresh one.
+    """
+    global _scan_pool
+    pool = _get_scan_pool()
+    try:
+        return pool.submit(scan_form_multi, path, tax_year=tax_year)
+    except BrokenProcessPool:
+        with _scan_pool_lock:
+            if _scan_pool is pool:
+                _scan_pool = None
+        pool.shutdown(wait=False)
+        return _get_scan_pool().submit(scan_form_multi, path, tax_year=tax_year)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_calculator(tax_year: int, filing_status: str) -> TaxCalculator:
+    """
+    Shared TaxCalculator per (tax_year, filing_status).
+
+    The calculation methods take all per-request data as arguments; the only
+    state a calculator accumulates is its price cache, which is safe to share.
+    """
+    return TaxCalculator(tax_year=tax_year, filing_status=filing_status)
+
+
+def _json_default(obj):
+    """Encode dates the way jsonify does (HTTP date strings)."""
+    if isinstance(obj, (date, datetime)):
+        return http_date(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json(obj):
+    """
+    JSON response for obj. Uses orjson when installed (same output as
+    jsonify) and falls back to jsonify for anything orjson cannot encode.
+    """
+    if HAS_ORJSON:
+        try:
+            body = orjson.dumps(
+                obj,
+                default=_json_default,
+                option=(orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+                        | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME),
+            )
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            return app.response_class(body, mimetype='application/json')
+    return jsonify(obj)
+
+
+def _payload_float(payload: dict, key: str, default: float = 0.0) -> float:
+    """Read a numeric field from a JSON payload; missing or blank values give default."""
+    value = payload.get(key)
+    return float(value) if value else default
+
+
+def _make_upload_dir(prefix: str) -> str:
+    """
+    Temp directory for this request's uploads. Uses RAM-backed /dev/shm when
+    it exists and has room for the request body, else the system temp dir.
+    """
+    if os.path.isdir(_SHM_DIR):
+        try:
+            st = os.statvfs(_SHM_DIR)
+            if st.f_bavail * st.f_frsize > 2 * (request.content_length or 0):
+                return tempfile.mkdtemp(prefix=prefix, dir=_SHM_DIR)
+        except OSError:
+            pass
+    return tempfile.mkdtemp(prefix=prefix)
+
+
+def _upload_path(tmp_dir: str, filename: str, index: int = 0) -> str:
+    """
+    Path in tmp_dir to save an uploaded file to. The client's name is
+    sanitized (keeping its extension, which the scanner dispatches on) and
+    prefixed with index so files sharing a name do not overwrite each other.
+    """
+    stem, ext = os.path.splitext(filename)
+    name = secure_filename(stem) or 'upload'
+    ext = secure_filename(ext.lstrip('.'))
+    return os.path.join(tmp_dir, f"{index}_{name}.{ext}" if ext else f"{index}_{name}")
+
+
+def _save_upload(f, path: str) -> str:
+    """Stream an uploaded file to path and return its SHA-256 hex digest."""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as dst:
+        while True:
+            chunk = f.stream.read(_UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+
+# Scan results keyed by (file SHA-256, extension, tax year, scanner version), so
+# re-uploading the same form skips the PDF/OCR parse. Off unless
+# TAXAPP_SCAN_CACHE=1; only form_type/data are stored (never raw_text), and
+# entries expire after SCAN_CACHE_TTL_SECONDS. Opened on first use.
+SCAN_CACHE_ENABLED = os.environ.get('TAXAPP_SCAN_CACHE', '') not in ('', '0')
+SCAN_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+SCAN_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'taxapp', 'scan_cache.db')
+_scan_db = SqliteCache(
+    SCAN_CACHE_PATH,
+    # secure_delete overwrites expired rows instead of leaving them in free pages.
+    # Earlier layouts: 'scans' also stored raw_text, 'scan_results' had no ext key.
+    'PRAGMA secure_delete = ON;'
+    'DROP TABLE IF EXISTS scans;'
+    'DROP TABLE IF EXISTS scan_results;'
+    'CREATE TABLE IF NOT EXISTS scan_cache ('
+    'sha256 TEXT, ext TEXT, tax_year INTEGER, scanner_version TEXT, created REAL, results TEXT, '
+    'PRIMARY KEY (sha256, ext, tax_year, scanner_version));',
+    'Scan cache', 'uploads will always be rescanned',
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _scanner_version() -> str:
+    """
+    Hash of the form_scanner and form_parsers sources, so a parser fix
+    invalidates results cached by the old code. Unreadable files (e.g. in a
+    frozen build) are skipped.
+    """
+    import form_scanner
+    import form_parsers
+    parser_dir = os.path.dirname(form_parsers.__file__)
+    paths = [form_scanner.__file__] + sorted(
+        os.path.join(parser_dir, name) for name in os.listdir(parser_dir) if name.endswith('.py')
+    )
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            with open(path, 'rb') as src:
+                digest.update(src.read())
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+def _scan_ext(path: str) -> str:
+    """The extension form_scanner picks its text extractor by, as a cache key part."""
+    return os.path.splitext(path)[1].lower()
+
+
+def _read_cached_scan(sha: str, ext: str, tax_year: int):
+    """Return the cached scan_form_multi results for a file, or None on a miss."""
+    if not SCAN_CACHE_ENABLED:
+        return None
+    with _scan_db.lock:
+        db = _scan_db.connection()
+        if db is None:
+            return None
+        row = db.execute(
+            'SELECT results FROM scan_cache WHERE sha256 = ? AND ext = ? '
+            'AND tax_year = ? AND scanner_version = ? AND created >= ?',
+            (sha, ext, tax_year, _scanner_version(), time.time() - SCAN_CACHE_TTL_SECONDS),
+        ).fetchone()
+    if not row:
+        return None
+    return [dict(scanned, raw_text='') for scanned in json.loads(row[0])]
+
+
+def _write_cached_scan(sha: str, ext: str, tax_year: int, scanned_list: list) -> None:
+    """Persist the form_type/data of scan_form_multi results for a file."""
+    if not SCAN_CACHE_ENABLED:
+        return
+    try:
+        # Dates are stored as the same strings /upload sends the client
+        blob = json.dumps([
+            {'form_type': scanned['form_type'], 'data': scanned['data']}
+            for scanned in scanned_list
+        ], default=_json_default)
+    except (TypeError, ValueError) as e:
+        print(f"Warning: Scan results not cached ({e})")
+        return
+    now = time.time()
+    with _scan_db.lock:
+        db = _scan_db.connection()
+        if db is None:
+            return
+        db.execute('DELETE FROM scan_cache WHERE created < ?', (now - SCAN_CACHE_TTL_SECONDS,))
+        db.execute(
+            'INSERT OR REPLACE INTO scan_cache '
+            '(sha256, ext, tax_year, scanner_version, created, results) VALUES (?, ?, ?, ?, ?, ?)',
+            (sha, ext, tax_year, _scanner_version(), now, blob),
+        )
+        db.commit()
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Reject oversized uploads with JSON the frontend can display."""
+    max_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return _json({'error': f'Upload too large (max {max_mb} MB)'}), 413
 
 
 @app.route('/')
@@ -41,72 +293,84 @@ def upload():
     """Accept uploaded files, scan each, return extracted data as JSON."""
     files = request.files.getlist('files')
     if not files:
-        return jsonify({'error': 'No files uploaded'}), 400
+        return _json({'error': 'No files uploaded'}), 400
 
     tax_year = request.form.get('tax_year', type=int) or datetime.now().year
-    tmp_dir = tempfile.mkdtemp(prefix='taxapp_')
+    tmp_dir = _make_upload_dir('taxapp_')
 
     results = []
     try:
-        for f in files:
-            if not f.filename:
-                continue
-            tmp_path = os.path.join(tmp_dir, f.filename)
-            f.save(tmp_path)
+        named = [f for f in files if f.filename]
+        use_pool = len(named) > 1
+
+        # One zero-argument callable per file that returns its scan results.
+        # With a pool, each file is submitted as soon as it is on disk, so
+        # workers scan earlier files while later ones are still being written.
+        # Files already scanned for this tax year are served from the cache.
+        scans = []
+        for i, f in enumerate(named):
+            tmp_path = _upload_path(tmp_dir, f.filename, i)
+            sha = _save_upload(f, tmp_path)
+            cached = _read_cached_scan(sha, _scan_ext(tmp_path), tax_year)
+            if cached is not None:
+                scan = functools.partial(list, cached)
+            elif use_pool:
+                scan = _submit_scan(tmp_path, tax_year).result
+            else:
+                scan = functools.partial(scan_form_multi, tmp_path, tax_year=tax_year)
+            scans.append((f.filename, tmp_path, sha, cached is None, scan))
+
+        # Collect in upload order
+        for filename, tmp_path, sha, is_new, scan in scans:
             try:
-                scanned_list = scan_form_multi(tmp_path, tax_year=tax_year)
+                try:
+                    scanned_list = scan()
+                except BrokenProcessPool:
+                    # A worker died and took the pool's pending scans with it.
+                    # Retry once in a fresh pool; a file that breaks that one
+                    # too is reported as an error below.
+                    scanned_list = _submit_scan(tmp_path, tax_year).result()
+                if is_new:
+                    _write_cached_scan(sha, _scan_ext(tmp_path), tax_year, scanned_list)
                 for scanned in scanned_list:
-                    scanned['source_file'] = f.filename
+                    scanned['source_file'] = filename
                     results.append(scanned)
             except Exception as e:
                 results.append({
                     'form_type': 'error',
                     'data': {'error': str(e)},
-                    'source_file': f.filename,
+                    'source_file': filename,
                 })
     finally:
         shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    return jsonify({'forms': results, 'tax_year': tax_year})
-
-
-@app.route('/calculate', methods=['POST'])
-def calculate():
-    """Accept form data + settings, run tax calculation, return results."""
-    payload = request.get_json()
-    if not payload or 'forms' not in payload:
-        return jsonify({'error': 'Missing form data'}), 400
-
-    forms = payload['forms']
-    filing_status = payload.get('filing_status', 'single')
-    tax_year = payload.get('tax_year') or datetime.now().year
-    estimated_payments = float(payload.get('estimated_payments', 0))
-    manual_property_tax = float(payload.get('property_tax', 0))
-    manual_mortgage_interest = float(payload.get('mortgage_interest', 0))
-    rental_pct = float(payload.get('rental_pct', 0))
-
-    # Build inputs from the (possibly user-corrected) form data
-    inputs = build_tax_inputs(forms)
+    return _json({'forms': results, 'tax_year': tax_year})
 
-    # Manual values override 1098-extracted values
-    if manual_property_tax > 0:
-        inputs['property_taxes'] = manual_property_tax
-    if manual_mortgage_interest > 0:
-        inputs['mortgage_interest'] = manual_mortgage_interest
 
-    calc = TaxCalculator(tax_year=tax_year, filing_status=filing_status)
+def _run_calculation(inputs: dict, calc: TaxCalculator, rental_pct: float,
+                     estimated_payments: float) -> dict:
+    """
+    Run the federal + CA calculation for aggregated inputs and build the
+    response dict shared by /calculate and /calculate_midyear.
+    """
+    stock_results = inputs['stock_results']
+    mortgage_interest = inputs['mortgage_interest']
+    property_taxes = inputs['property_taxes']
+    personal_pct = 1.0 - rental_pct
 
     # Estimate AGI for mortgage insurance phaseout calculation
-    stock_gains = sum(r.get('total_gain', 0) for r in inputs['stock_results'])
+    st_gains = lt_gains = 0.0
+    if stock_results:
+        st_gains, lt_gains = split_stock_gains(stock_results)
+    stock_gains = st_gains + lt_gains
     estimated_agi = inputs['w2_wages'] + inputs['interest_income'] + stock_gains
 
     # Itemized deductions — consider whenever SALT or mortgage data exists
     itemized_result = None
-    if (inputs['mortgage_interest'] > 0 or inputs['property_taxes'] > 0
-            or inputs['state_tax_withheld'] > 0):
+    if mortgage_interest > 0 or property_taxes > 0 or inputs['state_tax_withheld'] > 0:
         itemized_result = calc.calculate_itemized_deductions(
-            mortgage_interest=inputs['mortgage_interest'],
-            property_taxes=inputs['property_taxes'],
+            mortgage_interest=mortgage_interest,
+            property_taxes=property_taxes,
             state_income_tax=inputs['state_tax_withheld'],
             mortgage_insurance=inputs['mortgage_insurance'],
             rental_pct=rental_pct,
@@ -117,30 +381,20 @@ def calculate():
     liability = calc.calculate_total_tax_liability(
         w2_wages=inputs['w2_wages'],
         federal_tax_withheld=inputs['fed_withheld'],
-        stock_results=inputs['stock_results'],
+        stock_results=stock_results,
         estimated_payments=estimated_payments,
         interest_income=inputs['interest_income'],
         itemized_result=itemized_result,
     )
 
-    report = calc.generate_tax_liability_report(liability, inputs['stock_results'])
+    report = calc.generate_tax_liability_report(liability, stock_results)
 
     # CA state tax
     ca_report = ''
     if inputs['state_wages'] > 0:
-        st_gains = sum(
-            r.get('total_gain', 0) for r in inputs['stock_results']
-            if not r.get('is_long_term', False)
-        )
-        lt_gains = sum(
-            r.get('total_gain', 0) for r in inputs['stock_results']
-            if r.get('is_long_term', False)
-        )
         ca_itemized = None
-        personal_pct = 1.0 - rental_pct
-        if inputs['mortgage_interest'] > 0 or inputs['property_taxes'] > 0:
-            ca_itemized = (inputs['mortgage_interest'] * personal_pct
-                           + inputs['property_taxes'] * personal_pct)
+        if mortgage_interest > 0 or property_taxes > 0:
+            ca_itemized = mortgage_interest * personal_pct + property_taxes * personal_pct
 
         ca_result = calc.calculate_ca_state_tax(
             w2_state_wages=inputs['state_wages'],
@@ -166,7 +420,7 @@ def calculate():
             'effective_rate': ca_result.get('ca_effective_rate', 0),
         }
 
-    return jsonify({
+    return {
         'report': full_report,
         'federal': {
             'agi': liability.get('agi', 0),
@@ -181,25 +435,76 @@ def calculate():
         },
         'california': ca_summary,
         'inputs': inputs,
-    })
+    }
+
+
+@app.route('/calculate', methods=['POST'])
+def calculate():
+    """Accept form data + settings, run tax calculation, return results."""
+    payload = request.get_json()
+    if not payload or 'forms' not in payload:
+        return _json({'error': 'Missing form data'}), 400
+
+    forms = payload['forms']
+    filing_status = payload.get('filing_status', 'single')
+    tax_year = payload.get('tax_year') or datetime.now().year
+    estimated_payments = _payload_float(payload, 'estimated_payments')
+    manual_property_tax = _payload_float(payload, 'property_tax')
+    manual_mortgage_interest = _payload_float(payload, 'mortgage_interest')
+    rental_pct = _payload_float(payload, 'rental_pct')
+
+    # Build inputs from the (possibly user-corrected) form data
+    inputs = build_tax_inputs(forms)
+
+    # Manual values override 1098-extracted values
+    if manual_property_tax > 0:
+        inputs['property_taxes'] = manual_property_tax
+    if manual_mortgage_interest > 0:
+        inputs['mortgage_interest'] = manual_mortgage_interest
+
+    calc = _get_calculator(tax_year, filing_status)
+
+    return _json(_run_calculation(inputs, calc, rental_pct, estimated_payments))
+
+
+def _get_current_price(ticker: str) -> float:
+    """
+    Latest price for ticker via yfinance. Quotes are reused for
+    _QUOTE_TTL_SECONDS so repeated page interactions skip the network.
+    """
+    symbol = ticker.upper()
+    now = time.monotonic()
+    with _quote_cache_lock:
+        cached = _quote_cache.get(symbol)
+    if cached is not None and now - cached[0] < _QUOTE_TTL_SECONDS:
+        return cached[1]
+
+    import yfinance as yf
+    t = yf.Ticker(ticker)
+    info = t.fast_info
+    price = info.get('lastPrice', 0) or info.get('last_price', 0)
+    if not price:
+        # fallback: get from recent history
+        hist = t.history(period='1d')
+        if not hist.empty:
+            price = float(hist['Close'].iloc[-1])
+
+    if price:
+        with _quote_cache_lock:
+            if len(_quote_cache) >= _QUOTE_CACHE_MAX:
+                _quote_cache.clear()
+            _quote_cache[symbol] = (now, price)
+    return price
 
 
 @app.route('/stock_price/<ticker>', methods=['GET'])
 def stock_price(ticker):
     """Fetch current stock price via yfinance."""
     try:
-        import yfinance as yf
-        t = yf.Ticker(ticker)
-        info = t.fast_info
-        price = info.get('lastPrice', 0) or info.get('last_price', 0)
-        if not price:
-            # fallback: get from recent history
-            hist = t.history(period='1d')
-            if not hist.empty:
-                price = float(hist['Close'].iloc[-1])
-        return jsonify({'ticker': ticker.upper(), 'price': round(price, 2)})
+        price = _get_current_price(ticker)
+        return _json({'ticker': ticker.upper(), 'price': round(price, 2)})
     except Exception as e:
-        return jsonify({'error': str(e), 'ticker': ticker.upper(), 'price': 0}), 200
+        return _json({'error': str(e), 'ticker': ticker.upper(), 'price': 0}), 200
 
 
 @app.route('/upload_paystub', methods=['POST'])
@@ -207,16 +512,17 @@ def upload_paystub():
     """Accept a paystub PDF and return extracted YTD data as JSON."""
     f = request.files.get('file')
     if not f or not f.filename:
-        return jsonify({'error': 'No file uploaded'}), 400
+        return _json({'error': 'No file uploaded'}), 400
 
-    tmp_dir = tempfile.mkdtemp(prefix='taxapp_stub_')
+    tmp_dir = _make_upload_dir('taxapp_stub_')
     try:
-        tmp_path = os.path.join(tmp_dir, f.filename)
-        f.save(tmp_path)
+        tmp_path = _upload_path(tmp_dir, f.filename)
+        _save_upload(f, tmp_path)
+        from form_parsers.paystub_parser import parse_paystub
         data = parse_paystub(tmp_path)
-        return jsonify({'paystub': data})
+        return _json({'paystub': data})
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return _json({'error': str(e)}), 400
     finally:
         shutil.rmtree(tmp_dir, ignore_errors=True)
 
@@ -226,16 +532,17 @@ def upload_vesting():
     """Accept an E*TRADE XLSX vesting file and return parsed events as JSON."""
     f = request.files.get('file')
     if not f or not f.filename:
-        return jsonify({'error': 'No file uploaded'}), 400
+        return _json({'error': 'No file uploaded'}), 400
 
-    tmp_dir = tempfile.mkdtemp(prefix='taxapp_vest_')
+    tmp_dir = _make_upload_dir('taxapp_vest_')
     try:
-        tmp_path = os.path.join(tmp_dir, f.filename)
-        f.save(tmp_path)
+        tmp_path = _upload_path(tmp_dir, f.filename)
+        _save_upload(f, tmp_path)
+        from form_parsers.vesting_parser import parse_vesting_xlsx
         events = parse_vesting_xlsx(tmp_path)
-        return jsonify({'events': events})
+        return _json({'events': events})
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return _json({'error': str(e)}), 400
     finally:
         shutil.rmtree(tmp_dir, ignore_errors=True)
 
@@ -245,117 +552,54 @@ def calculate_midyear():
     """Accept mid-year data, project full year, and run tax calculation."""
     payload = request.get_json()
     if not payload:
-        return jsonify({'error': 'Missing request data'}), 400
+        return _json({'error': 'Missing request data'}), 400
 
     filing_status = payload.get('filing_status', 'single')
     tax_year = payload.get('tax_year') or datetime.now().year
-    estimated_payments = float(payload.get('estimated_payments', 0))
-    rental_pct = float(payload.get('rental_pct', 0))
+    estimated_payments = _payload_float(payload, 'estimated_payments')
+    rental_pct = _payload_float(payload, 'rental_pct')
 
     paystub_data = payload.get('paystub', {})
     vesting_events = payload.get('vesting_events', [])
     user_inputs = {
         'filing_status': filing_status,
         'tax_year': tax_year,
-        'estimated_stock_price': float(payload.get('estimated_stock_price', 0)),
+        'estimated_stock_price': _payload_float(payload, 'estimated_stock_price'),
         'planned_sales': payload.get('planned_sales', []),
-        'estimated_interest': float(payload.get('estimated_interest', 0)),
-        'mortgage_interest': float(payload.get('mortgage_interest', 0)),
-        'property_taxes': float(payload.get('property_taxes', 0)),
+        'estimated_interest': _payload_float(payload, 'estimated_interest'),
+        'mortgage_interest': _payload_float(payload, 'mortgage_interest'),
+        'property_taxes': _payload_float(payload, 'property_taxes'),
         'rental_pct': rental_pct,
         'estimated_payments': estimated_payments,
     }
 
     # Project full-year values
+    from projection_engine import project_full_year
     inputs, assumptions = project_full_year(paystub_data, vesting_events, user_inputs)
 
     # Run through TaxCalculator (same logic as /calculate)
-    calc = TaxCalculator(tax_year=tax_year, filing_status=filing_status)
-
-    stock_gains = sum(r.get('total_gain', 0) for r in inputs['stock_results'])
-    estimated_agi = inputs['w2_wages'] + inputs['interest_income'] + stock_gains
-
-    itemized_result = None
-    if (inputs['mortgage_interest'] > 0 or inputs['property_taxes'] > 0
-            or inputs['state_tax_withheld'] > 0):
-        itemized_result = calc.calculate_itemized_deductions(
-            mortgage_interest=inputs['mortgage_interest'],
-            property_taxes=inputs['property_taxes'],
-            state_income_tax=inputs['state_tax_withheld'],
-            mortgage_insurance=inputs['mortgage_insurance'],
-            rental_pct=rental_pct,
-            agi=estimated_agi,
-        )
+    calc = _get_calculator(tax_year, filing_status)
 
-    liability = calc.calculate_total_tax_liability(
-        w2_wages=inputs['w2_wages'],
-        federal_tax_withheld=inputs['fed_withheld'],
-        stock_results=inputs['stock_results'],
-        estimated_payments=estimated_payments,
-        interest_income=inputs['interest_income'],
-        itemized_result=itemized_result,
-    )
+    result = _run_calculation(inputs, calc, rental_pct, estimated_payments)
+    result['is_projection'] = True
+    result['assumptions'] = assumptions
+    return _json(result)
 
-    report = calc.generate_tax_liability_report(liability, inputs['stock_results'])
 
-    # CA state tax
-    ca_report = ''
-    ca_summary = {}
-    if inputs['state_wages'] > 0:
-        st_gains = sum(
-            r.get('total_gain', 0) for r in inputs['stock_results']
-            if not r.get('is_long_term', False)
-        )
-        lt_gains = sum(
-            r.get('total_gain', 0) for r in inputs['stock_results']
-            if r.get('is_long_term', False)
-        )
-        ca_itemized = None
-        personal_pct = 1.0 - rental_pct
-        if inputs['mortgage_interest'] > 0 or inputs['property_taxes'] > 0:
-            ca_itemized = (inputs['mortgage_interest'] * personal_pct
-                           + inputs['property_taxes'] * personal_pct)
+def run_server(port: int = 8080) -> None:
+    """
+    Serve the app on localhost.
 
-        ca_result = calc.calculate_ca_state_tax(
-            w2_state_wages=inputs['state_wages'],
-            interest_income=inputs['interest_income'],
-            stock_short_term_gains=st_gains,
-            stock_long_term_gains=lt_gains,
-            ca_itemized_deductions=ca_itemized,
-            state_tax_withheld=inputs['state_tax_withheld'],
-        )
-        ca_report = calc.generate_ca_tax_report_section(ca_result)
-        ca_summary = {
-            'total_income': ca_result.get('ca_total_income', 0),
-            'taxable_income': ca_result.get('ca_taxable_income', 0),
-            'total_tax': ca_result.get('ca_tax', 0),
-            'withheld': ca_result.get('ca_state_tax_withheld', 0),
-            'net_due': ca_result.get('ca_net_tax_due', 0),
-            'refund': ca_result.get('ca_refund', 0),
-            'effective_rate': ca_result.get('ca_effective_rate', 0),
-        }
-
-    full_report = report + ca_report
-
-    return jsonify({
-        'report': full_report,
-        'is_projection': True,
-        'assumptions': assumptions,
-        'federal': {
-            'agi': liability.get('agi', 0),
-            'taxable_income': liability.get('total_taxable_income', 0),
-            'total_tax': liability.get('total_tax_liability', 0),
-            'withheld': liability.get('total_payments', 0),
-            'net_due': liability.get('net_tax_due', 0),
-            'refund': liability.get('refund', 0),
-            'effective_rate': liability.get('effective_tax_rate', 0),
-            'deduction_type': liability.get('deduction_type', ''),
-            'deduction_amount': liability.get('deduction_amount', 0),
-        },
-        'california': ca_summary,
-        'inputs': inputs,
-    })
+    Uses waitress (multi-threaded, no debugger) when installed, otherwise
+    Flask's threaded server. Set FLASK_DEBUG=1 for the debugger/reloader.
+    """
+    if os.environ.get('FLASK_DEBUG', '') not in ('', '0'):
+        app.run(debug=True, port=port)
+    elif HAS_WAITRESS:
+        serve(app, host='127.0.0.1', port=port, threads=8, channel_timeout=300)
+    else:
+        app.run(port=port, threaded=True, use_reloader=False)
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=8080)
+    run_server(8080)